@@ -4,6 +4,8 @@
 
 from __future__ import absolute_import, division, print_function
 
+import inspect
+
 from muninn._compat import string_types as basestring
 
 from muninn.schema import *
@@ -14,9 +16,33 @@ from muninn.visitor import TypeVisitor
 # TODO separate into configuration parser and individual field parser?
 # TODO missing stuff eg, visit_Real..
 
+# Visit functions, by (parser type, configuration type). The visit function is looked up only once, on first use.
+_VISIT_FUNCS = {}
+
+
+def _find_visit_func(parser_type, type):
+    for type_ in inspect.getmro(type):
+        try:
+            return getattr(parser_type, "visit_%s" % type_.__name__)
+        except AttributeError:
+            pass
+    return parser_type.default
+
+
 class _ConfigParser(TypeVisitor):
     def visit(self, type, value):
-        return super(_ConfigParser, self).visit(type, value, "")
+        return self._visit(type, value, "")
+
+    def _visit(self, type, value, path):
+        return self._visit_func(type)(self, type, value, path)
+
+    def _visit_func(self, type):
+        key = self.__class__, type
+        try:
+            return _VISIT_FUNCS[key]
+        except KeyError:
+            visit_func = _VISIT_FUNCS[key] = _find_visit_func(*key)
+            return visit_func
 
     def visit_Integer(self, type, value, path):
         try:
@@ -59,7 +85,7 @@ class _ConfigParser(TypeVisitor):
             except KeyError:
                 raise ValueError(prefix_message_with_path(join(path, sub_name), "unrecognized configuration option"))
 
-            mapping[sub_name] = super(_ConfigParser, self).visit(sub_type, sub_value, join(path, sub_name))
+            mapping[sub_name] = self._visit(sub_type, sub_value, join(path, sub_name))
         return mapping
 
     def visit_Sequence(self, type, value, path):
@@ -68,10 +94,12 @@ class _ConfigParser(TypeVisitor):
         if not isinstance(value, basestring):
             raise ValueError(prefix_message_with_path(path, "invalid value %r for type %r" % (value, type.name())))
 
+        sub_type = type.sub_type
+        visit_func = self._visit_func(sub_type)
         sequence = []
         for index, sub_value in enumerate(value.split()):
             sub_path = path + "[%d]" % index
-            sequence.append(super(_ConfigParser, self).visit(type.sub_type, sub_value, sub_path))
+            sequence.append(visit_func(self, sub_type, sub_value, sub_path))
         return sequence
 
     def default(self, type, value, path):
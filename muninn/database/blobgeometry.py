@@ -17,62 +17,117 @@ class GeometryType(Enum):
     _items = ("GEOMETRY", "POINT", "LINESTRING", "POLYGON", "MULTIPOINT", "MULTILINESTRING", "MULTIPOLYGON")
 
 
+# Layout of a complete BLOB-Geometry for a single point: start, endian, SRID, MBR, MBR end, WKB type code, x, y, end.
+POINT_BLOB_FORMAT = "BBIddddBIddB"
+POINT_BLOB_SIZE = struct.calcsize("<" + POINT_BLOB_FORMAT)
+
+# Offset of the WKB type code in a BLOB-Geometry (i.e. the size of the header: start, endian, SRID, MBR, MBR end).
+WKB_TYPE_OFFSET = struct.calcsize("<BBIddddB")
+
+
+# Compiled struct formats (including byte order prefix), by format string.
+_STRUCTS = {}
+
+
+def _compile(format):
+    try:
+        return _STRUCTS[format]
+    except KeyError:
+        _STRUCTS[format] = compiled = struct.Struct(format)
+        return compiled
+
+
 class BLOBGeometryEncoder(Visitor):
+    """Encode geometries as the WKB-like part of a SQLite BLOB-Geometry.
+
+    The encoding is written to a single bytearray buffer, instead of concatenating the encodings of the individual
+    geometries that make up a (multi-)geometry.
+
+    """
+
     def __init__(self, little_endian=True):
         self.endianness = int(little_endian)
         self.prefix = (">", "<")[little_endian]
-        self.entity = self._encode("B", 0x69)
+        self.buffer = bytearray()
+        # Pack functions of compiled struct formats (for this byte order), by format string without prefix.
+        self._packers = {}
 
     def visit(self, visitable, tagged=True):
-        return super(BLOBGeometryEncoder, self).visit(visitable, tagged)
+        self.buffer = bytearray()
+        self._write(visitable, tagged)
+        return bytes(self.buffer)
 
     def visit_Point(self, visitable, tagged):
-        wkb = self._encode("dd", visitable.x, visitable.y)
-        return self._encode_tag(GeometryType.POINT) + wkb if tagged else wkb
+        if tagged:
+            self._encode_tag(GeometryType.POINT)
+        self._encode("dd", visitable.x, visitable.y)
 
     def visit_LineString(self, visitable, tagged):
-        wkb = self._encode("I", len(visitable))
-        wkb += b"".join([self.visit(point, False) for point in visitable])
-        return self._encode_tag(GeometryType.LINESTRING) + wkb if tagged else wkb
+        self._encode_count(GeometryType.LINESTRING, len(visitable), tagged)
+        self._encode_points(visitable)
 
     def visit_LinearRing(self, visitable, tagged):
         if len(visitable) == 0:
-            wkb = self._encode("I", 0)
+            self._encode_count(GeometryType.LINESTRING, 0, tagged)
         else:
-            wkb = self._encode("I", len(visitable) + 1)
-            wkb += b"".join([self.visit(point, False) for point in visitable])
-            wkb += self.visit(visitable.point(0), False)
-        return self._encode_tag(GeometryType.LINESTRING) + wkb if tagged else wkb
+            self._encode_count(GeometryType.LINESTRING, len(visitable) + 1, tagged)
+            self._encode_points(list(visitable) + [visitable.point(0)])
 
     def visit_Polygon(self, visitable, tagged):
-        wkb = self._encode("I", len(visitable))
-        wkb += b"".join([self.visit(ring, False) for ring in visitable])
-        return self._encode_tag(GeometryType.POLYGON) + wkb if tagged else wkb
+        self._encode_count(GeometryType.POLYGON, len(visitable), tagged)
+        for ring in visitable:
+            self._write(ring, False)
 
     def visit_MultiPoint(self, visitable, tagged):
-        wkb = self._encode("I", len(visitable))
-        wkb += b"".join([self.entity + self.visit(point, True) for point in visitable])
-        return self._encode_tag(GeometryType.MULTIPOINT) + wkb if tagged else wkb
+        self._encode_sequence(GeometryType.MULTIPOINT, visitable, tagged)
 
     def visit_MultiLineString(self, visitable, tagged):
-        wkb = self._encode("I", len(visitable))
-        wkb += b"".join([self.entity + self.visit(line_string, True) for line_string in visitable])
-        return self._encode_tag(GeometryType.MULTILINESTRING) + wkb if tagged else wkb
+        self._encode_sequence(GeometryType.MULTILINESTRING, visitable, tagged)
 
     def visit_MultiPolygon(self, visitable, tagged):
-        wkb = self._encode("I", len(visitable))
-        wkb += b"".join([self.entity + self.visit(polygon, True) for polygon in visitable])
-        return self._encode_tag(GeometryType.MULTIPOLYGON) + wkb if tagged else wkb
+        self._encode_sequence(GeometryType.MULTIPOLYGON, visitable, tagged)
 
     def default(self, visitable, tagged):
         raise Error("unsupported type: %s" % type(visitable).__name__)
 
+    def _write(self, visitable, tagged):
+        super(BLOBGeometryEncoder, self).visit(visitable, tagged)
+
+    def _encode_sequence(self, wkb_type, visitable, tagged):
+        self._encode_count(wkb_type, len(visitable), tagged)
+        for geometry in visitable:
+            self._encode("B", 0x69)
+            self._write(geometry, True)
+
+    def _encode_points(self, points):
+        coordinates = []
+        for point in points:
+            coordinates.append(point.x)
+            coordinates.append(point.y)
+        # The format depends on the number of points, so it is not added to the registry of compiled formats.
+        try:
+            self.buffer += struct.pack("%s%dd" % (self.prefix, len(coordinates)), *coordinates)
+        except struct.error as _error:
+            raise Error("encoding error: %s" % str(_error))
+
+    def _encode_count(self, wkb_type, count, tagged):
+        # Encode the element count of a geometry, preceded by its WKB type code if tagged.
+        if tagged:
+            self._encode("II", wkb_type, count)
+        else:
+            self._encode("I", count)
+
     def _encode_tag(self, wkb_type):
-        return self._encode("I", wkb_type)
+        self._encode("I", wkb_type)
 
     def _encode(self, format, *args):
         try:
-            return struct.pack(self.prefix + format, *args)
+            pack = self._packers[format]
+        except KeyError:
+            pack = self._packers[format] = _compile(self.prefix + format).pack
+
+        try:
+            self.buffer += pack(*args)
         except struct.error as _error:
             raise Error("encoding error: %s" % str(_error))
 
@@ -83,46 +138,63 @@ class BLOBGeometryStream(object):
         self.offset = 0
         self.prefix = "="
 
-    def decode(self, format):
-        return self._decode(self.prefix, format)
+    def decode_one(self, format):
+        """Decode a single value."""
+        return self._decode(format)[0]
+
+    def decode_tuple(self, format):
+        """Decode a tuple of values."""
+        return self._decode(format)
 
-    def tail(self):
-        return self.wkb[self.offset:]
+    def decode_points(self, count):
+        """Decode an array of count points, using a single struct call for all coordinates."""
+        # The coordinates are converted in C by a single call, independent of the number of points. What remains per
+        # point is the creation of the Point instance, which an array based decoder (e.g. numpy.frombuffer) would not
+        # avoid either.
+        format = "%s%dd" % (self.prefix, 2 * count)
+
+        try:
+            coordinates = struct.unpack_from(format, self.wkb, self.offset)
+        except struct.error as _error:
+            raise Error("decoding error: %s" % str(_error))
+
+        self.offset += 16 * count
+        iterator = iter(coordinates)
+        return [Point(x, y) for x, y in zip(iterator, iterator)]
 
     def set_endian(self, little_endian):
         self.prefix = (">", "<")[little_endian]
 
-    def _decode(self, prefix, format):
-        format = prefix + format
+    def _decode(self, format):
+        compiled = _compile(self.prefix + format)
 
         try:
-            start, end = self.offset, self.offset + struct.calcsize(format)
-            values = struct.unpack(format, self.wkb[start:end])
+            values = compiled.unpack_from(self.wkb, self.offset)
         except struct.error as _error:
             raise Error("decoding error: %s" % str(_error))
 
-        self.offset = end
-        return values[0] if len(values) == 1 else values
+        self.offset += compiled.size
+        return values
 
 
 def _decode_point(stream):
-    return Point(*stream.decode("dd"))
+    return Point(*stream.decode_tuple("dd"))
 
 
 def _decode_line_string(stream):
-    count = stream.decode("I")
-    return LineString([_decode_point(stream) for _ in range(count)])
+    count = stream.decode_one("I")
+    return LineString(stream.decode_points(count))
 
 
 def _decode_linear_ring(stream):
-    count = stream.decode("I")
+    count = stream.decode_one("I")
     if count == 0:
         return LinearRing()
 
     if count < 4:
         raise Error("linear ring should be empty or should contain >= 4 points")
 
-    points = [_decode_point(stream) for _ in range(count)]
+    points = stream.decode_points(count)
     if points[-1] != points[0]:
         raise Error("linear ring should be closed")
 
@@ -130,15 +202,15 @@ def _decode_linear_ring(stream):
 
 
 def _decode_polygon(stream):
-    count = stream.decode("I")
+    count = stream.decode_one("I")
     return Polygon([_decode_linear_ring(stream) for _ in range(count)])
 
 
 def _decode_geometry_sequence(stream, expected_wkb_type):
-    count = stream.decode("I")
+    count = stream.decode_one("I")
     sequence = []
     for _ in range(count):
-        entity = stream.decode("B")
+        entity = stream.decode_one("B")
         if entity != 0x69:
             raise Error("invalid SQLite BLOB-Geometry")
         sequence.append(_decode_wkb(stream, expected_wkb_type))
@@ -158,7 +230,7 @@ def _decode_multi_polygon(stream):
 
 
 def _decode_wkb(stream, expected_wkb_type=None):
-    wkb_type = stream.decode("I")
+    wkb_type = stream.decode_one("I")
 
     if expected_wkb_type is not None and wkb_type != expected_wkb_type:
         raise Error("unexpected WKB type code: %s (expected: %s)" % (wkb_type, expected_wkb_type))
@@ -179,46 +251,100 @@ def _decode_wkb(stream, expected_wkb_type=None):
     raise Error("unsupported WKB type code: %d" % wkb_type)
 
 
+def _encode_point_blob(point, little_endian):
+    prefix = (">", "<")[little_endian]
+    x, y = point.x, point.y
+    try:
+        return struct.pack(prefix + POINT_BLOB_FORMAT, 0, int(little_endian), 4326, x, y, x, y, 0x7c,
+                           GeometryType.POINT, x, y, 0xfe)
+    except struct.error as _error:
+        raise Error("encoding error: %s" % str(_error))
+
+
+def _decode_point_blob(blob):
+    prefix = (">", "<")[struct.unpack_from("B", blob, 1)[0]]
+    start, _, srid, _, _, _, _, mbr_end, wkb_type, x, y, end = struct.unpack(prefix + POINT_BLOB_FORMAT, blob)
+    if start != 0 or mbr_end != 0x7c or end != 0xfe:
+        raise Error("invalid SQLite BLOB-Geometry")
+    if srid != 4326:
+        raise Error("unsupported SRID code: %d" % srid)
+    if wkb_type != GeometryType.POINT:
+        raise Error("unexpected WKB type code: %s (expected: %s)" % (wkb_type, GeometryType.POINT))
+    return Point(x, y)
+
+
 def encode_blob_geometry(geometry):
     little_endian = (sys.byteorder == 'little')
-    srid = 4326
+    if type(geometry) is Point:
+        # Points are by far the most common geometry, and have a fixed size encoding.
+        return _encode_point_blob(geometry, little_endian)
+
     encoder = BLOBGeometryEncoder(little_endian)
-    # Start
-    blob = encoder._encode("B", 0)
-    # ENDIAN
-    blob += encoder._encode("B", int(little_endian))
-    # SRID
-    blob += encoder._encode("I", srid)
-    # MBR_MIN_X
-    blob += encoder._encode("d", geometry.min_x)
-    # MBR_MIN_Y
-    blob += encoder._encode("d", geometry.min_y)
-    # MBR_MAX_X
-    blob += encoder._encode("d", geometry.max_x)
-    # MBR_MAX_Y
-    blob += encoder._encode("d", geometry.max_y)
-    # MBR_END
-    blob += encoder._encode("B", 0x7c)
+    # Start, ENDIAN, SRID, MBR_MIN_X, MBR_MIN_Y, MBR_MAX_X, MBR_MAX_Y, MBR_END
+    encoder._encode("BBIddddB", 0, int(little_endian), 4326, geometry.min_x, geometry.min_y, geometry.max_x,
+                    geometry.max_y, 0x7c)
     # 'WKB' of geometry
-    blob += encoder.visit(geometry)
+    encoder._write(geometry, True)
     # LAST
-    blob += encoder._encode("B", 0xfe)
-    return blob
+    encoder._encode("B", 0xfe)
+    return bytes(encoder.buffer)
 
 
-def decode_blob_geometry(blob):
-    stream = BLOBGeometryStream(blob)
-    if stream.decode("B") != 0:
+def _decode_header(blob):
+    """Decode the fixed size header of a SQLite BLOB-Geometry.
+
+    Return the byte order, the SRID code, and the offset of the WKB part of the BLOB-Geometry.
+
+    """
+    try:
+        start, little_endian = struct.unpack_from("BB", blob)
+    except struct.error as _error:
+        raise Error("decoding error: %s" % str(_error))
+
+    if start != 0 or little_endian not in (0, 1):
         raise Error("invalid SQLite BLOB-Geometry")
-    stream.set_endian(stream.decode("B"))
-    srid = stream.decode("I")
+
+    # Start, ENDIAN, SRID, MBR_MIN_X, MBR_MIN_Y, MBR_MAX_X, MBR_MAX_Y, MBR_END
+    header = _compile((">", "<")[little_endian] + "BBIddddB")
+    try:
+        _, _, srid, _, _, _, _, mbr_end = header.unpack_from(blob)
+    except struct.error as _error:
+        raise Error("decoding error: %s" % str(_error))
+
+    if mbr_end != 0x7c:
+        raise Error("invalid SQLite BLOB-Geometry")
+
+    return little_endian, srid, header.size
+
+
+def _peek_wkb_type(blob):
+    """Return the WKB type code of a SQLite BLOB-Geometry (without validating the header), or None if the byte order
+    is invalid.
+
+    """
+    try:
+        little_endian = struct.unpack_from("B", blob, 1)[0]
+        if little_endian not in (0, 1):
+            return None
+        return struct.unpack_from((">", "<")[little_endian] + "I", blob, WKB_TYPE_OFFSET)[0]
+    except struct.error as _error:
+        raise Error("decoding error: %s" % str(_error))
+
+
+def decode_blob_geometry(blob):
+    if len(blob) == POINT_BLOB_SIZE and _peek_wkb_type(blob) == GeometryType.POINT:
+        # Points are by far the most common geometry, and have a fixed size encoding. Other geometries can have the
+        # same size (e.g. a polygon with three empty rings), so the WKB type code is checked as well.
+        return _decode_point_blob(blob)
+
+    little_endian, srid, offset = _decode_header(blob)
     if srid != 4326:
         raise Error("unsupported SRID code: %d" % srid)
-    # MBR
-    stream.decode("dddd")
-    if stream.decode("B") != 0x7c:
-        raise Error("invalid SQLite BLOB-Geometry")
+
+    stream = BLOBGeometryStream(blob)
+    stream.set_endian(little_endian)
+    stream.offset = offset
     geometry = _decode_wkb(stream)
-    if stream.decode("B") != 0xfe:
+    if stream.decode_one("B") != 0xfe:
         raise Error("invalid SQLite BLOB-Geometry")
     return geometry
@@ -4,7 +4,7 @@
 
 from __future__ import absolute_import, division, print_function
 
-import codecs
+import binascii
 import struct
 
 from muninn.enum import Enum
@@ -17,64 +17,141 @@ class GeometryType(Enum):
     _items = ("GEOMETRY", "POINT", "LINESTRING", "POLYGON", "MULTIPOINT", "MULTILINESTRING", "MULTIPOLYGON")
 
 
+# Compiled struct formats (including byte order prefix), by format string.
+_STRUCTS = {}
+
+
+def _compile(format):
+    try:
+        return _STRUCTS[format]
+    except KeyError:
+        _STRUCTS[format] = compiled = struct.Struct(format)
+        return compiled
+
+
+_BYTE_ORDER = struct.Struct("B")
+
+
+def _default_tags():
+    tags = {}
+    for endianness, prefix in enumerate((">", "<")):
+        for geometry_type in range(GeometryType.count()):
+            tags[endianness, None, geometry_type] = struct.pack(prefix + "BI", endianness, geometry_type)
+            tags[endianness, 4326, geometry_type] = struct.pack(prefix + "BII", endianness, geometry_type | 0x20000000,
+                                                                4326)
+    return tags
+
+
+# Layout of the (little endian) EWKB for a single point with SRID: byte order, type code, SRID, x, y.
+_POINT_EWKB = struct.Struct("<BIIdd")
+
+# Encoded geometry tags without SRID, and with the default SRID, by (endianness, SRID, geometry type).
+_TAGS = _default_tags()
+
+
 class EWKBEncoder(Visitor):
+    """Encode geometries as (E)WKB.
+
+    The encoding is written to a single bytearray buffer, instead of concatenating the encodings of the individual
+    geometries that make up a (multi-)geometry.
+
+    """
+
     def __init__(self, little_endian=True, srid=4326):
         self.endianness = int(little_endian)
         self.srid = srid
         self.prefix = (">", "<")[little_endian]
+        self.buffer = bytearray()
 
     def visit(self, visitable, tagged=True, srid=True):
-        return super(EWKBEncoder, self).visit(visitable, tagged, srid)
+        self.buffer = bytearray()
+        self._write(visitable, tagged, srid)
+        return bytes(self.buffer)
 
     def visit_Point(self, visitable, tagged, srid):
-        ewkb = self._encode("dd", visitable.x, visitable.y)
-        return self._encode_tag(GeometryType.POINT, srid) + ewkb if tagged else ewkb
+        if tagged:
+            self._encode_tag(GeometryType.POINT, srid)
+        self._encode("dd", visitable.x, visitable.y)
 
     def visit_LineString(self, visitable, tagged, srid):
-        ewkb = self._encode("I", len(visitable))
-        ewkb += b"".join([self.visit(point, False) for point in visitable])
-        return self._encode_tag(GeometryType.LINESTRING, srid) + ewkb if tagged else ewkb
+        if tagged:
+            self._encode_tag(GeometryType.LINESTRING, srid)
+        self._encode("I", len(visitable))
+        self._encode_points(visitable)
 
     def visit_LinearRing(self, visitable, tagged, srid):
+        if tagged:
+            self._encode_tag(GeometryType.LINESTRING, srid)
         if len(visitable) == 0:
-            ewkb = self._encode("I", 0)
+            self._encode("I", 0)
         else:
-            ewkb = self._encode("I", len(visitable) + 1)
-            ewkb += b"".join([self.visit(point, False) for point in visitable])
-            ewkb += self.visit(visitable.point(0), False)
-        return self._encode_tag(GeometryType.LINESTRING, srid) + ewkb if tagged else ewkb
+            self._encode("I", len(visitable) + 1)
+            self._encode_points(visitable, closed=True)
 
     def visit_Polygon(self, visitable, tagged, srid):
-        ewkb = self._encode("I", len(visitable))
-        ewkb += b"".join([self.visit(ring, False) for ring in visitable])
-        return self._encode_tag(GeometryType.POLYGON, srid) + ewkb if tagged else ewkb
+        if tagged:
+            self._encode_tag(GeometryType.POLYGON, srid)
+        self._encode("I", len(visitable))
+        for ring in visitable:
+            self._write(ring, False, False)
 
     def visit_MultiPoint(self, visitable, tagged, srid):
-        ewkb = self._encode("I", len(visitable))
-        ewkb += b"".join([self.visit(point, True, False) for point in visitable])
-        return self._encode_tag(GeometryType.MULTIPOINT, srid) + ewkb if tagged else ewkb
+        self._encode_sequence(GeometryType.MULTIPOINT, visitable, tagged, srid, Point, self.visit_Point)
 
     def visit_MultiLineString(self, visitable, tagged, srid):
-        ewkb = self._encode("I", len(visitable))
-        ewkb += b"".join([self.visit(line_string, True, False) for line_string in visitable])
-        return self._encode_tag(GeometryType.MULTILINESTRING, srid) + ewkb if tagged else ewkb
+        self._encode_sequence(GeometryType.MULTILINESTRING, visitable, tagged, srid, LineString,
+                              self.visit_LineString)
 
     def visit_MultiPolygon(self, visitable, tagged, srid):
-        ewkb = self._encode("I", len(visitable))
-        ewkb += b"".join([self.visit(polygon, True, False) for polygon in visitable])
-        return self._encode_tag(GeometryType.MULTIPOLYGON, srid) + ewkb if tagged else ewkb
+        self._encode_sequence(GeometryType.MULTIPOLYGON, visitable, tagged, srid, Polygon, self.visit_Polygon)
 
     def default(self, visitable, tagged, srid):
         raise Error("unsupported type: %s" % type(visitable).__name__)
 
+    def _write(self, visitable, tagged, srid):
+        # Dispatch to the visit function without creating a super() proxy for every (sub-)geometry.
+        Visitor.visit(self, visitable, tagged, srid)
+
+    def _encode_sequence(self, geometry_type, visitable, tagged, srid, sub_type, visit_func):
+        if tagged:
+            self._encode_tag(geometry_type, srid)
+        self._encode("I", len(visitable))
+        # Sub-geometries are tagged, but do not repeat the SRID. Sub-geometries of the expected type are passed to the
+        # visit function directly, anything else (e.g. a subclass) goes through the regular dispatch.
+        for geometry in visitable:
+            if type(geometry) is sub_type:
+                visit_func(geometry, True, False)
+            else:
+                self._write(geometry, True, False)
+
+    def _encode_points(self, points, closed=False):
+        # If closed is True, the first point is repeated at the end (as required for linear rings).
+        coordinates = []
+        for point in points:
+            coordinates.append(point.x)
+            coordinates.append(point.y)
+        if closed:
+            coordinates.extend(coordinates[:2])
+
+        # The format depends on the number of points, so it is not added to the registry of compiled formats.
+        try:
+            self.buffer += struct.pack("%s%dd" % (self.prefix, len(coordinates)), *coordinates)
+        except struct.error as _error:
+            raise Error("encoding error: %s" % str(_error))
+
     def _encode_tag(self, geometry_type, srid):
-        if srid and self.srid is not None:
-            return self._encode("BII", self.endianness, geometry_type | 0x20000000, self.srid)
-        return self._encode("BI", self.endianness, geometry_type)
+        srid = bool(srid and self.srid is not None)
+        try:
+            self.buffer += _TAGS[self.endianness, self.srid if srid else None, geometry_type]
+        except KeyError:
+            if srid:
+                self._encode("BII", self.endianness, geometry_type | 0x20000000, self.srid)
+            else:
+                self._encode("BI", self.endianness, geometry_type)
 
     def _encode(self, format, *args):
         try:
-            return struct.pack(self.prefix + format, *args)
+            self.buffer += _compile(self.prefix + format).pack(*args)
         except struct.error as _error:
             raise Error("encoding error: %s" % str(_error))
 
@@ -83,24 +160,61 @@ class EWKBStream(object):
     def __init__(self, ewkb):
         self.ewkb = ewkb
         self.offset = 0
-        self.prefix = (">", "<")[self._decode("=", "B")]
+        self.prefix = "="
 
     def decode(self, format):
         return self._decode(self.prefix, format)
 
-    def tail(self):
-        return self.ewkb[self.offset:]
+    def decode_points(self, count, closed=False):
+        """Decode an array of count points, using a single struct call for all coordinates.
+
+        The coordinates are decoded immediately, but the points are returned as an iterator, to be consumed by the
+        constructor of the geometry that contains them (which stores the points in a list of its own).
+
+        If closed is True, the last point should be equal to the first point, and is not included in the result.
+
+        """
+        # The format depends on the number of points, so it is not added to the registry of compiled formats. Geometry
+        # instances hold Point objects, so decoding into a numpy array first would only add a conversion step.
+        format = "%s%dd" % (self.prefix, 2 * count)
+
+        try:
+            coordinates = struct.unpack_from(format, self.ewkb, self.offset)
+        except struct.error as _error:
+            raise Error("decoding error: %s" % str(_error))
+
+        self.offset += 16 * count
+        if closed:
+            if coordinates[-2:] != coordinates[:2]:
+                raise Error("linear ring should be closed")
+            coordinates = coordinates[:-2]
+
+        iterator = iter(coordinates)
+        return (Point(x, y) for x, y in zip(iterator, iterator))
+
+    def decode_byte_order(self):
+        # Each (sub-)geometry starts with its own byte order marker. A single byte is read directly, without going
+        # through the registry of compiled formats (indexing the buffer would return a str in Python 2).
+        try:
+            byte_order, = _BYTE_ORDER.unpack_from(self.ewkb, self.offset)
+        except struct.error as _error:
+            raise Error("decoding error: %s" % str(_error))
+
+        if byte_order not in (0, 1):
+            raise Error("invalid EWKB byte order: %d" % byte_order)
+
+        self.offset += 1
+        self.prefix = (">", "<")[byte_order]
 
     def _decode(self, prefix, format):
-        format = prefix + format
+        compiled = _compile(prefix + format)
 
         try:
-            start, end = self.offset, self.offset + struct.calcsize(format)
-            values = struct.unpack(format, self.ewkb[start:end])
+            values = compiled.unpack_from(self.ewkb, self.offset)
         except struct.error as _error:
             raise Error("decoding error: %s" % str(_error))
 
-        self.offset = end
+        self.offset += compiled.size
         return values[0] if len(values) == 1 else values
 
 
@@ -110,7 +224,7 @@ def _decode_point(stream):
 
 def _decode_line_string(stream):
     count = stream.decode("I")
-    return LineString([_decode_point(stream) for _ in range(count)])
+    return LineString(stream.decode_points(count))
 
 
 def _decode_linear_ring(stream):
@@ -121,24 +235,17 @@ def _decode_linear_ring(stream):
     if count < 4:
         raise Error("linear ring should be empty or should contain >= 4 points")
 
-    points = [_decode_point(stream) for _ in range(count)]
-    if points[-1] != points[0]:
-        raise Error("linear ring should be closed")
-
-    return LinearRing(points[:-1])
+    return LinearRing(stream.decode_points(count, closed=True))
 
 
 def _decode_polygon(stream):
     count = stream.decode("I")
-    return Polygon([_decode_linear_ring(stream) for _ in range(count)])
+    return Polygon(_decode_linear_ring(stream) for _ in range(count))
 
 
 def _decode_geometry_sequence(stream, expected_ewkb_type):
-    sequence, count = [], stream.decode("I")
-    for _ in range(count):
-        stream = EWKBStream(stream.tail())
-        sequence.append(_decode_ewkb(stream, expected_ewkb_type))
-    return sequence
+    count = stream.decode("I")
+    return (_decode_ewkb(stream, expected_ewkb_type) for _ in range(count))
 
 
 def _decode_multi_point(stream):
@@ -153,7 +260,19 @@ def _decode_multi_polygon(stream):
     return MultiPolygon(_decode_geometry_sequence(stream, GeometryType.POLYGON))
 
 
+# Decoder functions, by EWKB type code.
+_DECODERS = {
+    GeometryType.POINT: _decode_point,
+    GeometryType.LINESTRING: _decode_line_string,
+    GeometryType.POLYGON: _decode_polygon,
+    GeometryType.MULTIPOINT: _decode_multi_point,
+    GeometryType.MULTILINESTRING: _decode_multi_line_string,
+    GeometryType.MULTIPOLYGON: _decode_multi_polygon,
+}
+
+
 def _decode_ewkb(stream, expected_ewkb_type=None):
+    stream.decode_byte_order()
     ewkb_type = stream.decode("I")
     ewkb_type, ewkb_flags = ewkb_type & 0x00FFFFFF, ewkb_type >> 28
 
@@ -167,33 +286,34 @@ def _decode_ewkb(stream, expected_ewkb_type=None):
     elif ewkb_flags != 0x00:
         raise Error("unsupported EWKB type flags: %d" % ewkb_flags)
 
-    if ewkb_type == GeometryType.POINT:
-        return _decode_point(stream)
-    elif ewkb_type == GeometryType.LINESTRING:
-        return _decode_line_string(stream)
-    elif ewkb_type == GeometryType.POLYGON:
-        return _decode_polygon(stream)
-    elif ewkb_type == GeometryType.MULTIPOINT:
-        return _decode_multi_point(stream)
-    elif ewkb_type == GeometryType.MULTILINESTRING:
-        return _decode_multi_line_string(stream)
-    elif ewkb_type == GeometryType.MULTIPOLYGON:
-        return _decode_multi_polygon(stream)
-
-    raise Error("unsupported EWKB type code: %d" % ewkb_type)
+    try:
+        decoder = _DECODERS[ewkb_type]
+    except KeyError:
+        raise Error("unsupported EWKB type code: %d" % ewkb_type)
+    return decoder(stream)
 
 
 def encode_ewkb(geometry):
+    if type(geometry) is Point:
+        # Points are by far the most common geometry, and have a fixed size encoding.
+        try:
+            return _POINT_EWKB.pack(1, GeometryType.POINT | 0x20000000, 4326, geometry.x, geometry.y)
+        except struct.error as _error:
+            raise Error("encoding error: %s" % str(_error))
+
     return EWKBEncoder().visit(geometry)
 
 
 def encode_hexewkb(geometry):
-    return codecs.encode(encode_ewkb(geometry), "hex").decode().upper()
+    return binascii.hexlify(encode_ewkb(geometry)).decode().upper()
 
 
-def decode_ewkb(ewkb):
-    return _decode_ewkb(EWKBStream(ewkb))
+def decode_ewkb(ewkb, offset=0):
+    """Decode the EWKB geometry that starts at the specified offset of a bytes-like object (e.g. bytes, bytearray)."""
+    stream = EWKBStream(ewkb)
+    stream.offset = offset
+    return _decode_ewkb(stream)
 
 
 def decode_hexewkb(hexewkb):
-    return decode_ewkb(codecs.decode(hexewkb, "hex"))
+    return decode_ewkb(binascii.unhexlify(hexewkb))
@@ -16,6 +16,12 @@ try:
 except ImportError:
     pass
 
+try:
+    import psycopg
+    from psycopg.adapt import Dumper as _PsycopgDumper, Loader as _PsycopgLoader
+except ImportError:
+    _PsycopgDumper = _PsycopgLoader = object
+
 try:
     import pg8000
     pg8000.paramstyle = 'pyformat'
@@ -34,12 +40,47 @@ from muninn.function import Prototype
 from muninn.schema import *
 from muninn.struct import Struct
 
-from muninn._compat import dictkeys, dictvalues, is_python2_unicode
+from muninn._compat import is_python2_unicode
 
 PG_UNIQUE_VIOLATION = '23505'
 
+# Number of rows fetched at once by a server-side cursor.
+SERVER_SIDE_CURSOR_ITERSIZE = 2000
+
+# Table prefixes consist of one or more dot separated parts of lower case letters and underscores.
+TABLE_PREFIX_PATTERN = re.compile(r"[a-z][_a-z]*(\.[a-z][_a-z]*)*\Z")
+
+# A keyword = value pair of a libpq connection string. Values that contain white space are enclosed in single quotes,
+# with single quotes and backslashes inside the value escaped by a backslash.
+CONNECTION_PARAMETER_PATTERN = re.compile(r"(\w+)\s*=\s*(?:'((?:[^'\\]|\\.)*)'|(\S+))")
+
+# SQL expressions for the supported property subscripts (timestamp and text properties), by subscript.
+SUBSCRIPT_FORMATS = {
+    # timestamp
+    'year': "TO_CHAR(%s, 'YYYY')",
+    'month': "TO_CHAR(%s, 'MM')",
+    'yearmonth': "TO_CHAR(%s, 'YYYY-MM')",
+    'day': "TO_CHAR(%s, 'DD')",
+    'date': "TO_CHAR(%s, 'YYYY-MM-DD')",
+    'hour': "TO_CHAR(%s, 'HH24')",
+    'minute': "TO_CHAR(%s, 'MI')",
+    'second': "TO_CHAR(%s, 'SS')",
+    'time': "TO_CHAR(%s, 'HH24:MI:SS')",
+    # text
+    'length': "CHAR_LENGTH(%s)",
+}
+
+
+def _get_db_type_id(connection, typename, type_ids=None):
+    """Return the object id of a database type.
+
+    If a dictionary of type ids (by type name) is specified, it is used to avoid querying the database for types that
+    were looked up before (type ids are fixed within a database).
+
+    """
+    if type_ids is not None and typename in type_ids:
+        return type_ids[typename]
 
-def _get_db_type_id(connection, typename):
     try:
         cursor = connection.cursor()
         try:
@@ -55,11 +96,14 @@ def _get_db_type_id(connection, typename):
     else:
         connection.commit()
 
+    if type_ids is not None:
+        type_ids[typename] = type_id
     return type_id
 
 
 def geometry_recv(data, offset, length):  # TODO binary send/recv needed for pg8000 <= 1.15
-    return ewkb.decode_ewkb(data[offset:offset+length])
+    # The EWKB encoding is self-delimiting, so it can be decoded in place (without copying it out of the buffer).
+    return ewkb.decode_ewkb(data, offset)
 
 
 def geometry_recv_hex(data):
@@ -74,19 +118,49 @@ def geometry_send_hex(geometry):
     return ewkb.encode_hexewkb(geometry)
 
 
-def _connect_pg8000(connection_string):
-    kwargs = dict(arg.split('=') for arg in connection_string.split(' '))
+def _parse_connection_string(connection_string):
+    kwargs = {}
+    for match in CONNECTION_PARAMETER_PATTERN.finditer(connection_string):
+        keyword, quoted_value, value = match.groups()
+        kwargs[keyword] = value if quoted_value is None else re.sub(r"\\(.)", r"\1", quoted_value)
+    return kwargs
+
+
+# Whether the register_out_adapter() method of a pg8000 connection takes an oid argument, by connection type.
+_REGISTER_OUT_ADAPTER_TAKES_OID = {}
+
+
+def _register_out_adapter_takes_oid(connection):
+    # pg8000 removed the oid argument in v1.22. The signature is only inspected once for each connection type.
+    connection_type = type(connection)
+    try:
+        return _REGISTER_OUT_ADAPTER_TAKES_OID[connection_type]
+    except KeyError:
+        try:
+            getargspec = inspect.getfullargspec
+        except AttributeError:
+            getargspec = inspect.getargspec
+        takes_oid = len(getargspec(connection.register_out_adapter).args) != 3
+        _REGISTER_OUT_ADAPTER_TAKES_OID[connection_type] = takes_oid
+        return takes_oid
+
+
+def _connect_pg8000(connection_string, type_ids=None):
+    kwargs = _parse_connection_string(connection_string)
     if 'dbname' in kwargs:
         kwargs['database'] = kwargs.pop('dbname')
     _connection = pg8000.connect(**kwargs)
 
-    geography_oid = _get_db_type_id(_connection, "geography")
+    geography_oid = _get_db_type_id(_connection, "geography", type_ids)
 
     if hasattr(_connection, 'register_in_adapter'):
         _connection.register_in_adapter(geography_oid, geometry_recv_hex)
     else:
         _connection.pg_types[geography_oid] = (pg8000.core.FC_BINARY, geometry_recv)
 
+    if hasattr(_connection, 'register_out_adapter'):
+        takes_oid = _register_out_adapter_takes_oid(_connection)
+
     for type_ in (
         geometry.Point,
         geometry.Polygon,
@@ -96,15 +170,10 @@ def _connect_pg8000(connection_string):
         geometry.MultiLineString,
     ):
         if hasattr(_connection, 'register_out_adapter'):
-            try:
-                getargspec = inspect.getfullargspec
-            except AttributeError:
-                getargspec = inspect.getargspec
-            # pg8000 removed the oid argument in v1.22
-            if len(getargspec(_connection.register_out_adapter).args) == 3:
-                _connection.register_out_adapter(type_, geometry_send_hex)
-            else:
+            if takes_oid:
                 _connection.register_out_adapter(type_, geography_oid, geometry_send_hex)
+            else:
+                _connection.register_out_adapter(type_, geometry_send_hex)
         else:
             _connection.py_types[type_] = (geography_oid, pg8000.core.FC_BINARY, geometry_send)
 
@@ -123,7 +192,7 @@ def _cast_geography(hexewkb, cursor):
     return ewkb.decode_hexewkb(hexewkb)
 
 
-def _connect_psycopg2(connection_string):
+def _connect_psycopg2(connection_string, type_ids=None):
     _connection = psycopg2.connect(connection_string)
 
     # Register adapter and cast for the UUID type.
@@ -133,13 +202,39 @@ def _connect_psycopg2(connection_string):
     psycopg2.extensions.register_adapter(geometry.Geometry, _adapt_geometry)
 
     # Register cast for the Geometry type.
-    geography_oid = _get_db_type_id(_connection, "geography")
+    geography_oid = _get_db_type_id(_connection, "geography", type_ids)
     geography_type = psycopg2.extensions.new_type((geography_oid,), "GEOGRAPHY", _cast_geography)
     psycopg2.extensions.register_type(geography_type, _connection)
 
     return _connection
 
 
+class _GeometryDumper(_PsycopgDumper):
+    """Dump a Geometry instance in hexadecimal extended well known binary format (hexewkb) (psycopg)."""
+
+    def dump(self, obj):
+        return ewkb.encode_hexewkb(obj).encode("ascii")
+
+
+class _GeographyLoader(_PsycopgLoader):
+    """Load a Geometry instance from its hexadecimal extended well known binary format (hexewkb) (psycopg)."""
+
+    def load(self, data):
+        return ewkb.decode_hexewkb(bytes(data))
+
+
+def _connect_psycopg(connection_string, type_ids=None):
+    _connection = psycopg.connect(connection_string)
+
+    # UUID values are adapted by psycopg itself. Register the dumper for the Geometry type (which also covers its
+    # sub-classes) and the loader for the geography type.
+    _connection.adapters.register_dumper(geometry.Geometry, _GeometryDumper)
+    geography_oid = _get_db_type_id(_connection, "geography", type_ids)
+    _connection.adapters.register_loader(geography_oid, _GeographyLoader)
+
+    return _connection
+
+
 class _PostgresqlConfig(Mapping):
     _alias = "postgresql"
 
@@ -160,40 +255,46 @@ class PostgresqlError(Error):
         super(PostgresqlError, self).__init__(message)
 
 
-def translate_errors(func):
-    """Decorator that translates db 2.0 api exceptions into muninn exceptions."""
-    @functools.wraps(func)
-    def translate_errors_(self, *args, **kwargs):
-        try:
-            return func(self, *args, **kwargs)
-        except self._connection._backend.Error as _error:
-            message = None
+def _error_message(library, error):
+    """Return the message of a db 2.0 api exception, without newlines and excessive whitespace."""
+    message = None
 
-            # psycopg2
-            if self._library == 'psycopg2':
+    # psycopg2, psycopg
+    if library in ('psycopg2', 'psycopg'):
+        try:
+            message = error.diag.message_primary
+            if message is not None:
                 try:
-                    message = _error.diag.message_primary
-                    if message is not None:
-                        try:
-                            message_detail = _error.diag.message_detail
-                            if message_detail:
-                                message += " [" + message_detail + "]"
-                        except AttributeError:
-                            pass
+                    message_detail = error.diag.message_detail
+                    if message_detail:
+                        message += " [" + message_detail + "]"
                 except AttributeError:
                     pass
+        except AttributeError:
+            pass
 
-            elif self._library == 'pg8000':
-                try:
-                    message = _error.args[0]['M']
-                except (TypeError, IndexError, AttributeError, KeyError):
-                    pass
+    elif library == 'pg8000':
+        try:
+            message = error.args[0]['M']
+        except (TypeError, IndexError, AttributeError, KeyError):
+            pass
+
+    # fallback
+    if message is None:
+        message = ' '.join(str(error).split())
 
-            # fallback
-            if message is None:
-                message = ' '.join(str(_error).split())
+    return message
 
-            raise PostgresqlError(message)
+
+def translate_errors(func):
+    """Decorator that translates db 2.0 api exceptions into muninn exceptions."""
+    @functools.wraps(func)
+    def translate_errors_(self, *args, **kwargs):
+        # The wrapper only adds a try block to a successful call. The error message is composed out of line.
+        try:
+            return func(self, *args, **kwargs)
+        except self._connection._backend.Error as _error:
+            raise PostgresqlError(_error_message(self._library, _error))
 
     return translate_errors_
 
@@ -207,12 +308,17 @@ class PostgresqlConnection(object):
     Only non-nested transactions are supported, no auto-commit or nested transactions. A transaction can be started
     using the context manager interface.
 
+    The connection is kept open across transactions (such that the connection setup and type registration are done
+    only once), until it is closed explicitly.
+
     """
     def __init__(self, connection_string, library):
         self._connection_string = connection_string
         self._library = library
         self._connection = None
         self._in_transaction = False
+        # Object ids of database types, by type name. These are looked up on the first connect only.
+        self._type_ids = {}
 
         if library == 'psycopg2':
             try:
@@ -220,6 +326,12 @@ class PostgresqlConnection(object):
             except NameError:
                 raise Error('could not import psycopg2')
 
+        elif library == 'psycopg':
+            try:
+                self._backend = psycopg
+            except NameError:
+                raise Error('could not import psycopg')
+
         elif library == 'pg8000':
             try:
                 self._backend = pg8000
@@ -237,6 +349,9 @@ class PostgresqlConnection(object):
             raise InternalError("nested transactions are not supported")
 
         # Reconnect if necessary.
+        if self._connection is not None and not self._is_alive():
+            # The connection was lost, e.g. because the server was restarted or closed the idle connection.
+            self._disconnect()
         if self._connection is None:
             self._connect()
 
@@ -252,19 +367,44 @@ class PostgresqlConnection(object):
                 self._connection.commit()
             else:
                 self._connection.rollback()
+        except Exception:
+            # The state of the connection is unknown, so start afresh on the next transaction.
+            self._in_transaction = False
+            self._disconnect()
+            raise
         finally:
             self._in_transaction = False
-            self.close()
 
     def _connect(self):
         # Re-establish the connection to the database.
         if self._library == 'psycopg2':
-            self._connection = _connect_psycopg2(self._connection_string)
+            self._connection = _connect_psycopg2(self._connection_string, self._type_ids)
+        elif self._library == 'psycopg':
+            self._connection = _connect_psycopg(self._connection_string, self._type_ids)
         else:
-            self._connection = _connect_pg8000(self._connection_string)
+            self._connection = _connect_pg8000(self._connection_string, self._type_ids)
+
+    def _is_alive(self):
+        # Check if the (cached) connection can still be used. The libraries only notice a lost connection when it is
+        # used, so a trivial query is sent to the server.
+        if getattr(self._connection, "closed", False):
+            return False
+        try:
+            cursor = self._connection.cursor()
+            try:
+                cursor.execute("SELECT 1")
+            finally:
+                cursor.close()
+        except self._backend.Error:
+            return False
+        return True
 
     def _disconnect(self):
-        self._connection.close()
+        try:
+            self._connection.close()
+        except self._backend.Error:
+            # The connection may already have been closed (e.g. by the server).
+            pass
         self._connection = None
 
     def close(self):
@@ -275,11 +415,23 @@ class PostgresqlConnection(object):
         if self._connection is not None:
             self._disconnect()
 
-    def cursor(self):
+    def cursor(self, name=None):
+        """Create a cursor.
+
+        If a name is specified, a server-side cursor is created (if supported by the library), that fetches the rows
+        of a query result in batches instead of transferring the complete result at once. A server-side cursor is
+        valid until the end of the transaction.
+
+        """
         if not self._in_transaction:
             raise InternalError("creating a cursor requires an active transaction")
 
-        return self._connection.cursor()
+        if name is None or self._library == 'pg8000':
+            return self._connection.cursor()
+
+        cursor = self._connection.cursor(name)
+        cursor.itersize = SERVER_SIDE_CURSOR_ITERSIZE
+        return cursor
 
     @property
     def encoding(self):
@@ -291,14 +443,20 @@ class PostgresqlBackend(DatabaseBackend):
         self._connection = PostgresqlConnection(connection_string, library)
         self._library = library
 
-        if table_prefix and not re.match(r"[a-z][_a-z]*(\.[a-z][_a-z]*)*", table_prefix):
+        if table_prefix and not TABLE_PREFIX_PATTERN.match(table_prefix):
             raise ValueError("invalid table_prefix %s" % table_prefix)
         self._table_prefix = table_prefix
+        # Table names (including the table prefix), by namespace name.
+        self._table_names = {}
 
         self._core_table_name = self._table_name("core")
         self._link_table_name = self._table_name("link")
         self._tag_table_name = self._table_name("tag")
 
+        # INSERT and UPDATE queries, by namespace and (sorted) tuple of field names.
+        self._insert_queries = {}
+        self._update_queries = {}
+
         self._namespace_schemas = {}
         self._sql_builder = sql.SQLBuilder({}, sql.TypeMap(), {}, self._table_name, self._placeholder,
                                            self._placeholder, self._rewriter_property)
@@ -324,6 +482,13 @@ class PostgresqlBackend(DatabaseBackend):
                     result.append("CREATE INDEX idx_%s_%s ON %s (%s);" %
                                   (self._core_table_name, name, self._core_table_name, name))
 
+        # Partial indexes for the queries of the automatic removal algorithm, which select active products of a given
+        # type (optionally only archived products) that are older than the grace period.
+        result.append("CREATE INDEX idx_%s_active_archive_date ON %s (archive_date) WHERE active AND archive_path IS "
+                      "NOT NULL;" % (self._core_table_name, self._core_table_name))
+        result.append("CREATE INDEX idx_%s_product_type_archive_date ON %s (product_type, archive_date) WHERE active;" %
+                      (self._core_table_name, self._core_table_name))
+
         # Create the tables for all non-core namespaces.
         for namespace in self._namespace_schemas:
             if namespace == "core":
@@ -356,8 +521,9 @@ class PostgresqlBackend(DatabaseBackend):
                       (self._link_table_name, self._link_table_name))
         result.append("ALTER TABLE %s ADD CONSTRAINT %s_uuid_fkey FOREIGN KEY (uuid) REFERENCES %s (uuid) ON "
                       "DELETE CASCADE;" % (self._link_table_name, self._link_table_name, self._core_table_name))
-        result.append("CREATE INDEX idx_%s_uuid ON %s (uuid);" % (self._link_table_name, self._link_table_name))
-        result.append("CREATE INDEX idx_%s_source_uuid ON %s (source_uuid);" %
+        # The index of the unique constraint on (uuid, source_uuid) is used to look up the source products of a
+        # product. The index below is used to look up the derived products of a product.
+        result.append("CREATE INDEX idx_%s_source_uuid_uuid ON %s (source_uuid, uuid);" %
                       (self._link_table_name, self._link_table_name))
 
         # Create the table for tags.
@@ -367,16 +533,19 @@ class PostgresqlBackend(DatabaseBackend):
                       (self._tag_table_name, self._tag_table_name))
         result.append("ALTER TABLE %s ADD CONSTRAINT %s_uuid_fkey FOREIGN KEY (uuid) REFERENCES %s (uuid) ON "
                       "DELETE CASCADE;" % (self._tag_table_name, self._tag_table_name, self._core_table_name))
-        result.append("CREATE INDEX idx_%s_uuid ON %s (uuid);" % (self._tag_table_name, self._tag_table_name))
+        # The index of the unique constraint on (uuid, tag) is used to look up the (sorted) tags of a product.
         result.append("CREATE INDEX idx_%s_tag ON %s (tag);" % (self._tag_table_name, self._tag_table_name))
         return result
 
     def _delete_product_properties(self, uuid):
+        # The links to the product and the product itself are deleted by a single statement. The row count is that of
+        # the (main) DELETE statement on the core table.
+        query = "WITH link AS (DELETE FROM %s WHERE source_uuid = %s) DELETE FROM %s WHERE uuid = %s" % \
+            (self._link_table_name, self._placeholder(), self._core_table_name, self._placeholder())
+
         cursor = self._connection.cursor()
         try:
-            cursor.execute("DELETE FROM %s WHERE source_uuid = %s" % (self._link_table_name, self._placeholder()),
-                           (uuid,))
-            cursor.execute("DELETE FROM %s WHERE uuid = %s" % (self._core_table_name, self._placeholder()), (uuid,))
+            cursor.execute(query, (uuid, uuid))
             assert cursor.rowcount <= 1
 
             if cursor.rowcount != 1:
@@ -391,7 +560,7 @@ class PostgresqlBackend(DatabaseBackend):
         cursor = self._connection.cursor()
         try:
             cursor.execute(query, parameters)
-            return [row[0] for row in cursor]
+            return [value for value, in cursor.fetchall()]
         finally:
             cursor.close()
 
@@ -399,14 +568,13 @@ class PostgresqlBackend(DatabaseBackend):
         with self._connection:
             cursor = self._connection.cursor()
             try:
-                cursor.execute("DROP TABLE IF EXISTS %s CASCADE" % self._tag_table_name)
-                cursor.execute("DROP TABLE IF EXISTS %s CASCADE" % self._link_table_name)
-                for namespace in self._namespace_schemas:
-                    if namespace != "core":
-                        cursor.execute("DROP TABLE IF EXISTS %s CASCADE" % self._table_name(namespace))
-                # remove 'core' table last
+                # All tables are dropped by a single statement (the order of the tables does not matter).
+                table_names = [self._tag_table_name, self._link_table_name]
+                table_names.extend(self._table_name(namespace) for namespace in self._namespace_schemas
+                                   if namespace != "core")
                 if "core" in self._namespace_schemas:
-                    cursor.execute("DROP TABLE IF EXISTS %s CASCADE" % self._core_table_name)
+                    table_names.append(self._core_table_name)
+                cursor.execute("DROP TABLE IF EXISTS %s CASCADE" % ", ".join(table_names))
             finally:
                 cursor.close()
 
@@ -422,21 +590,26 @@ class PostgresqlBackend(DatabaseBackend):
         core_properties = list(self._namespace_schema("core"))
         select_list = ["%s.%s" % (self._core_table_name, name) for name in core_properties]
 
-        query = "SELECT %s FROM %s WHERE active AND now() AT TIME ZONE 'UTC' - archive_date > %s AND uuid IN (SELECT " \
-                "uuid FROM %s EXCEPT SELECT DISTINCT link.uuid FROM %s AS link LEFT JOIN %s AS source ON " \
-                "(link.source_uuid = source.uuid) WHERE source.uuid IS NULL OR source.archive_path IS NOT NULL)" % \
+        # Select products that have at least one link, and no link to a source product that is available or that is
+        # not in the archive. Both conditions are expressed as (anti-)joins on the uuid of the product, instead of
+        # computing the set difference of all linked products and the products with an available source.
+        query = "SELECT %s FROM %s WHERE active AND archive_date < now() AT TIME ZONE 'UTC' - %s AND EXISTS (SELECT " \
+                "1 FROM %s AS link WHERE link.uuid = %s.uuid) AND NOT EXISTS (SELECT 1 FROM %s AS link LEFT JOIN %s " \
+                "AS source ON (link.source_uuid = source.uuid) WHERE link.uuid = %s.uuid AND (source.uuid IS NULL OR " \
+                "source.archive_path IS NOT NULL))" % \
                 (", ".join(select_list), self._core_table_name, self._placeholder(), self._link_table_name,
-                 self._link_table_name, self._core_table_name)
+                 self._core_table_name, self._link_table_name, self._core_table_name, self._core_table_name)
 
         if product_type is not None:
             query = "%s AND product_type = %s" % (query, self._placeholder())
 
-        cursor = self._connection.cursor()
+        # A server-side cursor avoids holding both the complete (raw) query result and the unpacked products in
+        # memory.
+        cursor = self._connection.cursor("find_products_without_available_source")
         try:
             cursor.execute(query, (grace_period,) if product_type is None else (grace_period, product_type))
 
-            description = [("core", core_properties)]
-            return [self._unpack_product_properties(description, row) for row in cursor]
+            return list(self._iter_product_properties(cursor, [("core", core_properties)]))
         finally:
             cursor.close()
 
@@ -444,7 +617,7 @@ class PostgresqlBackend(DatabaseBackend):
                                       archived_only=False):
         core_properties = list(self._namespace_schema("core"))
         select_list = ["%s.%s" % (self._core_table_name, name) for name in core_properties]
-        query = "SELECT %s FROM %s WHERE %s.active AND now() AT TIME ZONE 'UTC' - %s.archive_date > %s AND NOT " \
+        query = "SELECT %s FROM %s WHERE %s.active AND %s.archive_date < now() AT TIME ZONE 'UTC' - %s AND NOT " \
                 "EXISTS (SELECT 1 FROM %s WHERE %s.uuid = %s.uuid)" % (", ".join(select_list),
                                                                        self._core_table_name, self._core_table_name,
                                                                        self._core_table_name, self._placeholder(),
@@ -457,12 +630,13 @@ class PostgresqlBackend(DatabaseBackend):
         if archived_only:
             query = "%s AND archive_path IS NOT NULL" % query
 
-        cursor = self._connection.cursor()
+        # A server-side cursor avoids holding both the complete (raw) query result and the unpacked products in
+        # memory.
+        cursor = self._connection.cursor("find_products_without_source")
         try:
             cursor.execute(query, (grace_period,) if product_type is None else (grace_period, product_type))
 
-            description = [("core", core_properties)]
-            return [self._unpack_product_properties(description, row) for row in cursor]
+            return list(self._iter_product_properties(cursor, [("core", core_properties)]))
         finally:
             cursor.close()
 
@@ -472,22 +646,22 @@ class PostgresqlBackend(DatabaseBackend):
 
         # Split the properties into a list of (database) field names and a list of values. This assumes the database
         # field that corresponds to a given property has the same name. If the backend uses different field names, the
-        # required translation can be performed here. Values can also be translated if necessary.
-        properties_dict = vars(properties)
-        fields, parameters = dictkeys(properties_dict), dictvalues(properties_dict)
+        # required translation can be performed here. Values can also be translated if necessary. The field names are
+        # sorted, such that the same query is used for all products that define the same set of properties.
+        schema = self._namespace_schema(name)
+        properties_dict = properties.__dict__
+        fields = sorted(properties_dict)
+        parameters = [json.dumps(properties_dict[field]) if field != "uuid" and issubclass(schema[field], JSON) else
+                      properties_dict[field] for field in fields]
+
         # Ensure the uuid field is present (for namespaces other than the core namespace this is used as the foreign
         # key).
         if "uuid" not in properties:
             fields.append("uuid")
             parameters.append(uuid)
 
-        schema = self._namespace_schema(name)
-        parameters = [json.dumps(p) if f != "uuid" and issubclass(schema[f], JSON) else p for f, p in
-                      zip(fields, parameters)]
-
-        # Build and execute INSERT query.
-        query = "INSERT INTO %s (%s) VALUES (%s)" % (self._table_name(name), ", ".join(fields),
-                                                     ", ".join([self._placeholder()] * len(fields)))
+        # Execute INSERT query.
+        query = self._insert_query(name, tuple(fields))
 
         cursor = self._connection.cursor()
         try:
@@ -495,6 +669,15 @@ class PostgresqlBackend(DatabaseBackend):
         finally:
             cursor.close()
 
+    def _insert_query(self, name, fields):
+        key = (name, fields)
+        try:
+            return self._insert_queries[key]
+        except KeyError:
+            query = self._insert_queries[key] = "INSERT INTO %s (%s) VALUES (%s)" % \
+                (self._table_name(name), ", ".join(fields), ", ".join([self._placeholder()] * len(fields)))
+            return query
+
     def _delete_namespace_properties(self, uuid, name):
         query = "DELETE FROM %s WHERE uuid=%s" % (self._table_name(name), self._placeholder())
         cursor = self._connection.cursor()
@@ -515,6 +698,10 @@ class PostgresqlBackend(DatabaseBackend):
             except AttributeError:
                 pass
 
+        elif self._library == 'psycopg':
+            if getattr(_error, "sqlstate", None) == PG_UNIQUE_VIOLATION:
+                swallow = True
+
         elif self._library == 'pg8000':  # TODO positional - issue filed on github
             try:
                 if _error.args[0]['C'] == PG_UNIQUE_VIOLATION:
@@ -524,24 +711,63 @@ class PostgresqlBackend(DatabaseBackend):
 
         return swallow
 
-    def _link(self, uuid, source_uuids):
-        query = "INSERT INTO %s (uuid, source_uuid) SELECT %s, %s" % (self._link_table_name, self._placeholder(),
-                                                                      self._placeholder())
+    def _insert_missing(self, table_name, column_name, column_type, uuid, values):
+        """Insert a (uuid, value) row into a link or tag table for each value, skipping rows that already exist.
+
+        All rows are inserted by a single statement, in a single transaction. If a concurrent transaction inserts any
+        of the same rows in the meantime, the rows are inserted one by one instead.
 
-        query += " WHERE NOT EXISTS (SELECT 1 FROM %s WHERE uuid=%s and source_uuid=%s)" % (self._link_table_name,
-                                                                                            self._placeholder(),
-                                                                                            self._placeholder())
-        for source_uuid in source_uuids:
+        """
+        values = list(values)
+        if not values:
+            return
+
+        # INSERT ... ON CONFLICT DO NOTHING would require PostgreSQL 9.5 or higher.
+        rows = ", ".join(["(CAST(%s AS %s))" % (self._placeholder(), column_type)] * len(values))
+        query = "INSERT INTO %s (uuid, %s) SELECT DISTINCT %s, v.value FROM (VALUES %s) AS v (value)" % \
+            (table_name, column_name, self._placeholder(), rows)
+        query += " WHERE NOT EXISTS (SELECT 1 FROM %s WHERE uuid=%s and %s=v.value)" % \
+            (table_name, self._placeholder(), column_name)
+
+        try:
+            with self._connection:
+                cursor = self._connection.cursor()
+                try:
+                    cursor.execute(query, [uuid] + values + [uuid])
+                finally:
+                    cursor.close()
+        except self._connection._backend.Error as _error:
+            if not self._swallow_unique_violation(_error):
+                raise
+            self._insert_missing_one_by_one(table_name, column_name, uuid, values)
+
+    def _insert_missing_one_by_one(self, table_name, column_name, uuid, values):
+        query = "INSERT INTO %s (uuid, %s) SELECT %s, %s" % (table_name, column_name, self._placeholder(),
+                                                             self._placeholder())
+        query += " WHERE NOT EXISTS (SELECT 1 FROM %s WHERE uuid=%s and %s=%s)" % (table_name, self._placeholder(),
+                                                                                  column_name, self._placeholder())
+        for value in values:
             with self._connection:
                 cursor = self._connection.cursor()
                 try:
-                    cursor.execute(query, (uuid, source_uuid, uuid, source_uuid))
+                    cursor.execute(query, (uuid, value, uuid, value))
                 except self._connection._backend.Error as _error:
                     if not self._swallow_unique_violation(_error):
                         raise
                 finally:
                     cursor.close()
 
+    def _iter_product_properties(self, cursor, description):
+        # Rows are unpacked one at a time as they are fetched from the cursor. Note that the cursor can only be used
+        # while the enclosing transaction is active, so callers that return the results to outside code still need to
+        # collect them into a list first.
+        plan = self._unpack_plan(description)
+        for row in cursor:
+            yield self._unpack_product_properties(plan, row)
+
+    def _link(self, uuid, source_uuids):
+        self._insert_missing(self._link_table_name, "source_uuid", "uuid", uuid, source_uuids)
+
     def _namespace_schema(self, namespace):
         try:
             return self._namespace_schemas[namespace]
@@ -549,38 +775,19 @@ class PostgresqlBackend(DatabaseBackend):
             raise Error("undefined namespace: \"%s\"" % namespace)
 
     def _placeholder(self, name=None, arg=None):
-        if name is not None:
-            result = "%%(%s)s" % name
-            if isinstance(arg, datetime.datetime):
-                result += "::timestamp"
-        else:
-            result = "%s"
+        if name is None:
+            return "%s"
+
+        result = "%%(%s)s" % name
+        if isinstance(arg, datetime.datetime):
+            result += "::timestamp"
         return result
 
     def _rewriter_property(self, column_name, subscript):
-        # timestamp
-        if subscript == 'year':
-            return "TO_CHAR(%s, 'YYYY')" % column_name
-        if subscript == 'month':
-            return "TO_CHAR(%s, 'MM')" % column_name
-        if subscript == 'yearmonth':
-            return "TO_CHAR(%s, 'YYYY-MM')" % column_name
-        if subscript == 'day':
-            return "TO_CHAR(%s, 'DD')" % column_name
-        if subscript == 'date':
-            return "TO_CHAR(%s, 'YYYY-MM-DD')" % column_name
-        if subscript == 'hour':
-            return "TO_CHAR(%s, 'HH24')" % column_name
-        if subscript == 'minute':
-            return "TO_CHAR(%s, 'MI')" % column_name
-        if subscript == 'second':
-            return "TO_CHAR(%s, 'SS')" % column_name
-        if subscript == 'time':
-            return "TO_CHAR(%s, 'HH24:MI:SS')" % column_name
-        # text
-        if subscript == 'length':
-            return "CHAR_LENGTH(%s)" % column_name
-        raise ValueError('Unsupported subscript: %s' % subscript)
+        try:
+            return SUBSCRIPT_FORMATS[subscript] % column_name
+        except KeyError:
+            raise ValueError('Unsupported subscript: %s' % subscript)
 
     def _rewriter_table(self):
         rewriter_table = sql.default_rewriter_table()
@@ -670,29 +877,19 @@ class PostgresqlBackend(DatabaseBackend):
         cursor = self._connection.cursor()
         try:
             cursor.execute(query, parameters)
-            return [row[0] for row in cursor]
+            return [value for value, in cursor.fetchall()]
         finally:
             cursor.close()
 
     def _table_name(self, name):
-        return name if not self._table_prefix else self._table_prefix + name
+        try:
+            return self._table_names[name]
+        except KeyError:
+            table_name = self._table_names[name] = name if not self._table_prefix else self._table_prefix + name
+            return table_name
 
     def _tag(self, uuid, tags):
-        query = "INSERT INTO %s (uuid, tag) SELECT %s, %s" % (self._tag_table_name, self._placeholder(),
-                                                              self._placeholder())
-        query += " WHERE NOT EXISTS (SELECT 1 FROM %s WHERE uuid=%s and tag=%s)" % (self._tag_table_name,
-                                                                                    self._placeholder(),
-                                                                                    self._placeholder())
-        for tag in tags:
-            with self._connection:
-                cursor = self._connection.cursor()
-                try:
-                    cursor.execute(query, (uuid, tag, uuid, tag))
-                except self._connection._backend.Error as _error:
-                    if not self._swallow_unique_violation(_error):
-                        raise
-                finally:
-                    cursor.close()
+        self._insert_missing(self._tag_table_name, "tag", "text", uuid, tags)
 
     def _tags(self, uuid):
         query = "SELECT tag FROM %s WHERE uuid = %s ORDER BY tag" % (self._tag_table_name, self._placeholder())
@@ -701,7 +898,7 @@ class PostgresqlBackend(DatabaseBackend):
         cursor = self._connection.cursor()
         try:
             cursor.execute(query, parameters)
-            return [row[0] for row in cursor]
+            return [value for value, in cursor.fetchall()]
         finally:
             cursor.close()
 
@@ -724,35 +921,41 @@ class PostgresqlBackend(DatabaseBackend):
             query = "DELETE FROM %s WHERE uuid = %s" % (self._link_table_name, self._placeholder())
             parameters = (uuid,)
         else:
-            for source_uuid in source_uuids:
-                query = "DELETE FROM %s WHERE uuid = %s AND source_uuid = %s" % \
-                    (self._link_table_name, self._placeholder(), self._placeholder())
-                parameters = (uuid, source_uuid)
-                cursor = self._connection.cursor()
-                try:
-                    cursor.execute(query, parameters)
-                finally:
-                    cursor.close()
+            source_uuids = list(source_uuids)
+            if not source_uuids:
+                return
+
+            # All links are deleted by a single statement. The source uuids are passed as a single array parameter, such
+            # that the query does not depend on the number of source uuids.
+            query = "DELETE FROM %s WHERE uuid = %s AND source_uuid = ANY(CAST(%s AS UUID[]))" % \
+                (self._link_table_name, self._placeholder(), self._placeholder())
+            parameters = (uuid, source_uuids)
+
+        cursor = self._connection.cursor()
+        try:
+            cursor.execute(query, parameters)
+        finally:
+            cursor.close()
 
     def _untag(self, uuid, tags=None):
         if tags is None:
             query = "DELETE FROM %s WHERE uuid = %s" % (self._tag_table_name, self._placeholder())
             parameters = (uuid,)
-            cursor = self._connection.cursor()
-            try:
-                cursor.execute(query, parameters)
-            finally:
-                cursor.close()
         else:
-            for tag in tags:
-                query = "DELETE FROM %s WHERE uuid = %s AND tag = %s" % (self._tag_table_name,
-                                                                         self._placeholder(), self._placeholder())
-                parameters = (uuid, tag)
-                cursor = self._connection.cursor()
-                try:
-                    cursor.execute(query, parameters)
-                finally:
-                    cursor.close()
+            tags = list(tags)
+            if not tags:
+                return
+
+            # All tags are deleted by a single statement (see _unlink()).
+            query = "DELETE FROM %s WHERE uuid = %s AND tag = ANY(CAST(%s AS TEXT[]))" % \
+                (self._tag_table_name, self._placeholder(), self._placeholder())
+            parameters = (uuid, tags)
+
+        cursor = self._connection.cursor()
+        try:
+            cursor.execute(query, parameters)
+        finally:
+            cursor.close()
 
     def _update_namespace_properties(self, uuid, name, properties):
         self._validate_namespace_properties(name, properties, partial=True)
@@ -760,31 +963,25 @@ class PostgresqlBackend(DatabaseBackend):
 
         # Split the properties into a list of (database) field names and a list of values. This assumes the database
         # field that corresponds to a given property has the same name. If the backend uses different field names, the
-        # required translation can be performed here. Values can also be translated if necessary.
-        properties_dict = vars(properties)
-        fields, parameters = dictkeys(properties_dict), dictvalues(properties_dict)
+        # required translation can be performed here. Values can also be translated if necessary. The field names are
+        # sorted, such that the same query is used for all updates of the same set of properties.
+        #
+        # The uuid field is left out. This field needs to be included in the WHERE clause of the UPDATE query, not in
+        # the SET clause.
+        properties_dict = properties.__dict__
+        fields = sorted(field for field in properties_dict if field != "uuid")
         if not fields:
             return  # nothing to do
 
-        # Remove the uuid field if present. This field needs to be included in the WHERE clause of the UPDATE query,
-        # not in the SET clause.
-        try:
-            uuid_index = fields.index("uuid")
-        except ValueError:
-            pass
-        else:
-            del fields[uuid_index]
-            del parameters[uuid_index]
-
         schema = self._namespace_schema(name)
-        parameters = [json.dumps(p) if issubclass(schema[f], JSON) else p for f, p in zip(fields, parameters)]
+        parameters = [json.dumps(properties_dict[field]) if issubclass(schema[field], JSON) else properties_dict[field]
+                      for field in fields]
 
         # Append the uuid (value) at the end of the list of parameters (will be used in the WHERE clause).
         parameters.append(uuid)
 
-        # Build and execute UPDATE query.
-        set_clause = ", ".join(["%s = %s" % (field, self._placeholder()) for field in fields])
-        query = "UPDATE %s SET %s WHERE uuid = %s" % (self._table_name(name), set_clause, self._placeholder())
+        # Execute UPDATE query.
+        query = self._update_query(name, tuple(fields))
 
         cursor = self._connection.cursor()
         try:
@@ -796,23 +993,15 @@ class PostgresqlBackend(DatabaseBackend):
         finally:
             cursor.close()
 
-    def _unpack_namespace_properties(self, namespace, description, values):
-        unpacked_properties = Struct()
-        schema = self._namespace_schema(namespace)
-        for identifier, value in zip(description, values):
-            # We may get unicode from the (psycopg2) connection
-            # if, possibly by a third party, the UNICODE adapter is loaded.
-            # Muninn assumes strs
-            if is_python2_unicode(value):
-                value = value.encode(self._connection.encoding)
-
-            if value is not None or not schema.is_optional(identifier):
-                unpacked_properties[identifier] = value
+    def _unpack_plan(self, description):
+        """Return a plan for unpacking rows that match the specified query description.
 
-        return unpacked_properties
+        The plan contains a (namespace, uuid index, start, end, properties) tuple for each namespace, where properties
+        is a list of (identifier, is optional) tuples. Computing this once per query avoids schema lookups for every
+        row.
 
-    def _unpack_product_properties(self, description, values):
-        unpacked_properties, start = Struct(), 0
+        """
+        plan, start = [], 0
         for ns_name, ns_description in description:
             end = start + len(ns_description)
 
@@ -821,24 +1010,56 @@ class PostgresqlBackend(DatabaseBackend):
             # Otherwise, only the uuid field is skipped, as it is an implementation detail (foreign key) and it is not
             # part of the namespace itself.
             #
+            uuid_index = None
             if ns_name != "core":
                 assert ns_description[0] == "uuid"
-                if values[start] is None:
-                    # Skip the entire namespace.
-                    start = end
-                    continue
-
-                # Skip the uuid field.
-                start += 1
+                uuid_index = start
                 ns_description = ns_description[1:]
 
-            unpacked_ns_properties = self._unpack_namespace_properties(ns_name, ns_description, values[start:end])
+            schema = self._namespace_schema(ns_name)
+            ns_plan = [(identifier, schema.is_optional(identifier)) for identifier in ns_description]
+            plan.append((ns_name, uuid_index, end - len(ns_plan), end, ns_plan))
+            start = end
+
+        return plan
+
+    def _unpack_product_properties(self, plan, values):
+        unpacked_properties = Struct()
+        for ns_name, uuid_index, start, end, ns_plan in plan:
+            if uuid_index is not None and values[uuid_index] is None:
+                # Skip the entire namespace.
+                continue
+
+            unpacked_ns_properties = self._unpack_namespace_properties(ns_plan, values[start:end])
             self._validate_namespace_properties(ns_name, unpacked_ns_properties, partial=True)
             unpacked_properties[ns_name] = unpacked_ns_properties
-            start = end
 
         return unpacked_properties
 
+    def _unpack_namespace_properties(self, plan, values):
+        unpacked_properties = Struct()
+        for (identifier, is_optional), value in zip(plan, values):
+            # We may get unicode from the (psycopg2) connection
+            # if, possibly by a third party, the UNICODE adapter is loaded.
+            # Muninn assumes strs
+            if is_python2_unicode(value):
+                value = value.encode(self._connection.encoding)
+
+            if value is not None or not is_optional:
+                unpacked_properties[identifier] = value
+
+        return unpacked_properties
+
+    def _update_query(self, name, fields):
+        key = (name, fields)
+        try:
+            return self._update_queries[key]
+        except KeyError:
+            set_clause = ", ".join(["%s = %s" % (field, self._placeholder()) for field in fields])
+            query = self._update_queries[key] = "UPDATE %s SET %s WHERE uuid = %s" % \
+                (self._table_name(name), set_clause, self._placeholder())
+            return query
+
     def _validate_namespace_properties(self, namespace, properties, partial=False):
         self._namespace_schema(namespace).validate(properties, partial)
 
@@ -883,7 +1104,7 @@ class PostgresqlBackend(DatabaseBackend):
             cursor = self._connection.cursor()
             try:
                 cursor.execute(query, parameters)
-                return len(cursor.fetchall()) != 0
+                return cursor.fetchone() is not None
             finally:
                 cursor.close()
 
@@ -923,7 +1144,7 @@ class PostgresqlBackend(DatabaseBackend):
     def insert_product_properties(self, properties):
         with self._connection:
             self._insert_namespace_properties(properties.core.uuid, "core", properties.core)
-            for ns_name, ns_properties in vars(properties).items():
+            for ns_name, ns_properties in properties.__dict__.items():
                 if ns_name == "core" or ns_properties is None:
                     continue
                 self._insert_namespace_properties(properties.core.uuid, ns_name, ns_properties)
@@ -946,10 +1167,15 @@ class PostgresqlBackend(DatabaseBackend):
             self._sql_builder.build_search_query(where, order_by, limit, parameters, namespaces, property_names)
 
         with self._connection:
-            cursor = self._connection.cursor()
+            # Use a server-side cursor unless the result is known to fit in a single batch.
+            if limit is None or limit > SERVER_SIDE_CURSOR_ITERSIZE:
+                cursor = self._connection.cursor("search")
+            else:
+                cursor = self._connection.cursor()
+
             try:
                 cursor.execute(query, query_parameters)
-                return [self._unpack_product_properties(query_description, row) for row in cursor]
+                return list(self._iter_product_properties(cursor, query_description))
             finally:
                 cursor.close()
 
@@ -1017,7 +1243,7 @@ class PostgresqlBackend(DatabaseBackend):
 
         with self._connection:
             self._update_namespace_properties(uuid, "core", properties.core)
-            for ns_name, ns_properties in vars(properties).items():
+            for ns_name, ns_properties in properties.__dict__.items():
                 if ns_name == "core":
                     continue
                 if ns_name in new_namespaces:
@@ -5,12 +5,6 @@
 from __future__ import absolute_import, division, print_function
 
 import collections
-
-try:
-    from collections.abc import MutableMapping
-except ImportError:
-    from collections import MutableMapping
-
 import inspect
 
 from muninn.exceptions import *
@@ -46,8 +40,17 @@ GROUP_BY_FUNCTIONS = collections.OrderedDict([
     # (Geometry, []),
 ])
 
+# Column positions (as used in GROUP BY/ORDER BY clauses) for typical numbers of group_by fields.
+_POSITIONS = tuple(str(i) for i in range(1, 64))
+
+
+def _positions(count):
+    if count <= len(_POSITIONS):
+        return _POSITIONS[:count]
+    return tuple(str(i) for i in range(1, count + 1))
 
-class TypeMap(MutableMapping):
+
+class TypeMap(object):
     def __init__(self):
         self._types = {}
 
@@ -63,6 +66,13 @@ class TypeMap(MutableMapping):
     def __setitem__(self, key, value):
         self._types[key] = value
 
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
     def __delitem__(self, key):
         del self._types[key]
 
@@ -453,11 +463,24 @@ class SQLBuilder(object):
         if group_by_tag:
             group_by = group_by + ['tag']
 
+        # Identifiers are resolved once per query; the same field can be referenced by the group_by, aggregates and
+        # order_by specifications.
+        identifiers = {'count': Identifier.for_count()}
+        if group_by_tag:
+            identifiers['tag'] = Identifier.for_tag()
+
+        def identifier(name):
+            try:
+                return identifiers[name]
+            except KeyError:
+                ident = identifiers[name] = Identifier(name, self._namespace_schemas)
+                return ident
+
         join_set = set()
         result_fields = []
 
         for field in group_by + ['count'] + aggregates:
-            ident = Identifier(field, self._namespace_schemas)
+            ident = identifier(field)
             result_fields.append(ident.resolve)
             join_set.add(ident.namespace)
 
@@ -473,9 +496,9 @@ class SQLBuilder(object):
 
         # Generate the GROUP BY clause.
         group_by_clause = ''
-        group_by_list = [str(i) for i in range(1, len(group_by) + 1)]
-        if group_by_list:
-            group_by_clause = 'GROUP BY %s' % ', '.join(group_by_list)
+        group_by_positions = _positions(len(group_by))
+        if group_by_positions:
+            group_by_clause = 'GROUP BY %s' % ', '.join(group_by_positions)
 
         # Generate the HAVING clause
         having_clause = ''
@@ -493,11 +516,11 @@ class SQLBuilder(object):
         for item in order_by:
             direction = 'DESC' if item.startswith('-') else 'ASC'
             name = item[1:] if item.startswith('+') or item.startswith('-') else item
-            name = Identifier(name, self._namespace_schemas).resolve
+            name = identifier(name).resolve
             if name not in result_fields:
                 raise Error("cannot order result by %r; field is not present in result" % name)
             order_by_list.append('"%s" %s' % (name, direction))
-        order_by_list += [str(i) for i in range(1, len(group_by) + 1)]
+        order_by_list.extend(group_by_positions)
         if order_by_list:
             order_by_clause = 'ORDER BY %s' % ', '.join(order_by_list)
 
@@ -505,7 +528,7 @@ class SQLBuilder(object):
         select_list = []
         # group by fields
         for item in group_by:
-            item = Identifier(item, self._namespace_schemas)
+            item = identifier(item)
             column_name = self._column_name(item.namespace, item.identifier)
             group_by_functions = GROUP_BY_FUNCTIONS.get(item.muninn_type)
             if not group_by_functions:  # item.muninn_type not in (Text, Boolean, Long, Integer):
@@ -532,7 +555,7 @@ class SQLBuilder(object):
         # aggregated fields
         select_list.append('COUNT(*) AS count')  # always aggregate row count
         for item in aggregates:
-            item = Identifier(item, self._namespace_schemas)
+            item = identifier(item)
             join_set.add(item.namespace)
 
             if not AGGREGATE_FUNCTIONS.get(item.muninn_type):
@@ -576,6 +599,8 @@ class SQLBuilder(object):
         return query, where_parameters, result_fields
 
     def build_search_query(self, where="", order_by=[], limit=None, parameters={}, namespaces=[], property_names=[]):
+        # The SELECT list is built alongside the description of the result columns.
+        select_list = []
         if property_names:
             namespaces = []
             namespace_properties = {}
@@ -590,12 +615,20 @@ class SQLBuilder(object):
                 if identifier != 'uuid':
                     namespace_properties[namespace].append(identifier)
             join_set = set(namespaces)
-            description = [(namespace, namespace_properties[namespace]) for namespace in namespaces]
+            description = []
+            for namespace in namespaces:
+                identifiers = namespace_properties[namespace]
+                description.append((namespace, identifiers))
+                select_list.extend([self._column_name(namespace, identifier) for identifier in identifiers])
         else:
             join_set = set(namespaces)
-            description = [("core", list(self._namespace_schema("core")))]
+            identifiers = list(self._namespace_schema("core"))
+            description = [("core", identifiers)]
+            select_list.extend([self._column_name("core", identifier) for identifier in identifiers])
             for namespace in join_set:
-                description.append((namespace, ["uuid"] + list(self._namespace_schema(namespace))))
+                identifiers = ["uuid"] + list(self._namespace_schema(namespace))
+                description.append((namespace, identifiers))
+                select_list.extend([self._column_name(namespace, identifier) for identifier in identifiers])
 
         # Parse the where clause.
         where_clause, where_parameters = "", {}
@@ -629,9 +662,6 @@ class SQLBuilder(object):
             limit_clause = "LIMIT %d" % limit
 
         # Generate the SELECT clause.
-        select_list = []
-        for namespace, identifiers in description:
-            select_list.extend([self._column_name(namespace, identifier) for identifier in identifiers])
         select_clause = "SELECT %s" % ", ".join(select_list)
 
         # Generate the FROM clause.
@@ -6,6 +6,7 @@ from __future__ import absolute_import, division, print_function
 
 import os
 import re
+import contextlib
 import datetime
 import functools
 import json
@@ -13,8 +14,6 @@ import uuid
 
 from .base import DatabaseBackend
 
-from muninn._compat import dictkeys, dictvalues
-
 # Select a version of dbapi2 that's available.
 # Since we need the spatialite module, we need a version of sqlite3 that supports extensions.
 # The defaulft version of sqlite3 that comes with Python does not support this, so we prefer pysqlite2
@@ -41,6 +40,11 @@ class _SQLiteConfig(Mapping):
     connection_string = Text
     mod_spatialite_path = optional(Text)
     table_prefix = optional(Text)
+    journal_mode = optional(Text)
+    synchronous = optional(Text)
+    mmap_size = optional(Integer)
+    validate_on_read = optional(Boolean)
+    composite_indexes = optional(Boolean)
 
 
 def create(configuration):
@@ -49,6 +53,40 @@ def create(configuration):
     return SQLiteBackend(**options)
 
 
+JOURNAL_MODES = ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF")
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+# Number of prepared statements (keyed by SQL text) that the dbapi2 module keeps per connection. The cache is enlarged
+# for each namespace, because the insert, update, and delete statements are namespace specific.
+STATEMENT_CACHE_SIZE = 256
+STATEMENT_CACHE_SIZE_PER_NAMESPACE = 16
+
+# Table prefixes consist of one or more dot separated parts of lower case letters and underscores.
+TABLE_PREFIX_PATTERN = re.compile(r"[a-z][_a-z]*(\.[a-z][_a-z]*)*\Z")
+
+# Number of bits per dimension of the Hilbert curve used to order the entries of a spatial index when it is rebuilt.
+HILBERT_ORDER = 16
+
+# Maximum number of values in a single 'IN (...)' list (SQLITE_MAX_VARIABLE_NUMBER defaults to 999).
+MAX_IN_PARAMETERS = 500
+
+# SQL expressions for the supported property subscripts (timestamp and text properties), by subscript.
+SUBSCRIPT_FORMATS = {
+    # timestamp
+    'year': "STRFTIME('%%Y', %s)",
+    'month': "STRFTIME('%%m', %s)",
+    'yearmonth': "STRFTIME('%%Y-%%m', %s)",
+    'day': "STRFTIME('%%d', %s)",
+    'date': "STRFTIME('%%Y-%%m-%%d', %s)",
+    'hour': "STRFTIME('%%H', %s)",
+    'minute': "STRFTIME('%%M', %s)",
+    'second': "STRFTIME('%%S', %s)",
+    'time': "STRFTIME('%%H:%%M:%%S', %s)",
+    # text
+    'length': "LENGTH(%s)",
+}
+
+
 class SQLiteError(Error):
     def __init__(self, message=None):
         message = "sqlite backend error" + ("" if not message else ": " + message)
@@ -62,40 +100,48 @@ def translate_sqlite_errors(func):
         try:
             return func(*args, **kwargs)
         except dbapi2.Error as _error:
-            try:
-                message = _error.diag.message_primary
-            except AttributeError:
-                message = None
-
-            if message:
-                try:
-                    message_detail = _error.diag.message_detail
-                except AttributeError:
-                    message_detail = None
-
-                if message_detail:
-                    message += " [" + message_detail + "]"
-            else:
-                # Remove newlines and excessive whitespace from the original SQLite exception message.
-                message = " ".join(str(_error).split())
-
-            raise SQLiteError(message)
+            # Remove newlines and excessive whitespace from the original SQLite exception message.
+            raise SQLiteError(" ".join(str(_error).split()))
 
     return translate_sqlite_errors_
 
 
+def _placeholder_list(count):
+    """Return a comma separated list of the specified number of (positional) parameter placeholders."""
+    return ", ".join("?" * count)
+
+
+def _hilbert_key(x, y):
+    """Return the distance along a Hilbert curve covering the whole earth of the specified (longitude, latitude).
+
+    Inserting the entries of an R*Tree in this order results in a better clustered tree than inserting them in random
+    order.
+
+    """
+    if x is None or y is None:
+        return None
+
+    n = 1 << HILBERT_ORDER
+    x = min(max(int((x + 180.0) / 360.0 * n), 0), n - 1)
+    y = min(max(int((y + 90.0) / 180.0 * n), 0), n - 1)
+
+    d, s = 0, n >> 1
+    while s > 0:
+        rx, ry = int(x & s > 0), int(y & s > 0)
+        d += s * s * ((3 * rx) ^ ry)
+        if ry == 0:
+            if rx == 1:
+                x, y = n - 1 - x, n - 1 - y
+            x, y = y, x
+        s >>= 1
+    return d
+
+
 def _adapt_geometry(geometry):
     """Return the SQLite BLOB-Geometry representation of a Geometry instance."""
     return dbapi2.Binary(blobgeometry.encode_blob_geometry(geometry))
 
 
-def _cast_geometry(blob):
-    """Construct a Geometry instance from its SQLite BLOB-Geometry representation."""
-    if blob is None:
-        return blob
-    return blobgeometry.decode_blob_geometry(blob)
-
-
 class SQLiteConnection(object):
     """Wrapper for a sqlite database connection that defers (re)connection until an attempt is made to use the
     connection.
@@ -103,14 +149,25 @@ class SQLiteConnection(object):
     Only non-nested transactions are supported, no auto-commit or nested transactions. A transaction can be started
     using the context manager interface.
 
+    The connection is kept open across transactions (such that prepared statements remain cached), until it is closed
+    explicitly.
+
     """
-    def __init__(self, connection_string, mod_spatialite_path, backend):
+    def __init__(self, connection_string, mod_spatialite_path, backend, journal_mode="WAL", synchronous="NORMAL",
+                 mmap_size=268435456):
         self._connection_string = connection_string
         self._mod_spatialite = mod_spatialite_path
         self._connection = None
         self._in_transaction = False
         self._backend = backend
 
+        # The write-ahead log requires shared memory, which is not available for in-memory databases.
+        if journal_mode == "WAL" and self._is_memory_database():
+            journal_mode = "MEMORY"
+        self._journal_mode = journal_mode
+        self._synchronous = synchronous
+        self._mmap_size = mmap_size
+
     def __enter__(self):
         # Begin a transaction. The transaction is not started immediately, but a state change is recorded such that
         # attempts to start nested transactions can be detected. Also, the connection with the database is
@@ -135,18 +192,30 @@ class SQLiteConnection(object):
                 self._connection.commit()
             else:
                 self._connection.rollback()
+        except Exception:
+            # The state of the connection is unknown, so start afresh on the next transaction.
+            self._in_transaction = False
+            self._disconnect()
+            raise
         finally:
             self._in_transaction = False
-            self.close()
 
     def _connect(self):
         # Re-establish the connection to the database.
         need_prepare = not os.path.exists(self._connection_string)
-        self._connection = dbapi2.connect(self._connection_string, detect_types=dbapi2.PARSE_DECLTYPES)
+        self._connection = dbapi2.connect(self._connection_string, detect_types=dbapi2.PARSE_DECLTYPES,
+                                          cached_statements=self._backend._statement_cache_size())
 
         # make sure that foreign keys are enabled
         self._connection.execute("PRAGMA foreign_keys = ON;")
 
+        # configure journaling and caching
+        self._connection.execute("PRAGMA journal_mode = %s;" % self._journal_mode)
+        self._connection.execute("PRAGMA synchronous = %s;" % self._synchronous)
+        self._connection.execute("PRAGMA temp_store = MEMORY;")
+        self._connection.execute("PRAGMA cache_size = -8000;")
+        self._connection.execute("PRAGMA mmap_size = %d;" % self._mmap_size)
+
         # load the spatialite extension
         try:
             self._connection.enable_load_extension(True)
@@ -155,6 +224,9 @@ class SQLiteConnection(object):
             raise Error("loading mod_spatialite extension failed (mod_spatialite_path='%s'): %s" %
                         (self._mod_spatialite, str(e)))
 
+        # used to order the entries of spatial indexes when they are rebuilt
+        self._connection.create_function("muninn_hilbert_key", 2, _hilbert_key)
+
         # ensure that spatial metadata init has been done
         with self._connection:
             # enter auto-commit mode, to have complete control the transaction state
@@ -191,13 +263,19 @@ class SQLiteConnection(object):
         self._connection.close()
         self._connection = None
 
+    def _is_memory_database(self):
+        return self._connection_string == ":memory:" or self._connection_string.startswith("file::memory:")
+
     def close(self):
         if self._in_transaction:
             raise InternalError("unable to close the connection with the database while a transaction is in progress")
 
-        # Close the connection.
+        # Close the connection, after giving sqlite the opportunity to update the statistics used by the query planner.
         if self._connection is not None:
-            self._disconnect()
+            try:
+                self._connection.execute("PRAGMA optimize;")
+            finally:
+                self._disconnect()
 
     def cursor(self):
         if not self._in_transaction:
@@ -205,16 +283,38 @@ class SQLiteConnection(object):
 
         return self._connection.cursor()
 
+    def execute(self, query, parameters=()):
+        # Execute a (read-only) query using a temporary cursor, and return the cursor to fetch the results.
+        if not self._in_transaction:
+            raise InternalError("executing a query requires an active transaction")
+
+        return self._connection.execute(query, parameters)
+
+    def is_open(self):
+        return self._connection is not None
+
+    def set_synchronous(self, synchronous):
+        # Change the synchronous setting (also for future connections), and return the previous setting.
+        if self._in_transaction:
+            raise InternalError("unable to change the synchronous setting while a transaction is in progress")
+
+        previous, self._synchronous = self._synchronous, synchronous
+        if self._connection is not None:
+            self._connection.execute("PRAGMA synchronous = %s;" % synchronous)
+        return previous
+
 
 class SQLiteBackend(object):
-    def __init__(self, connection_string="", mod_spatialite_path="mod_spatialite", table_prefix=""):
+    def __init__(self, connection_string="", mod_spatialite_path="mod_spatialite", table_prefix="", journal_mode="WAL",
+                 synchronous="NORMAL", mmap_size=268435456, validate_on_read=False, composite_indexes=False):
         dbapi2.register_converter("BOOLEAN", lambda x: bool(int(x)))
         dbapi2.register_adapter(bool, lambda x: int(x))
 
         dbapi2.register_converter("UUID", lambda x: uuid.UUID(x.decode()))
         dbapi2.register_adapter(uuid.UUID, lambda x: x.hex)
 
-        dbapi2.register_converter("GEOMETRY", _cast_geometry)
+        # Converters are not called for NULL values, so the BLOB-Geometry decoder can be registered directly.
+        dbapi2.register_converter("GEOMETRY", blobgeometry.decode_blob_geometry)
         dbapi2.register_adapter(geometry.Point, _adapt_geometry)
         dbapi2.register_adapter(geometry.LineString, _adapt_geometry)
         dbapi2.register_adapter(geometry.Polygon, _adapt_geometry)
@@ -222,78 +322,93 @@ class SQLiteBackend(object):
         dbapi2.register_adapter(geometry.MultiLineString, _adapt_geometry)
         dbapi2.register_adapter(geometry.MultiPolygon, _adapt_geometry)
 
+        journal_mode, synchronous = journal_mode.upper(), synchronous.upper()
+        if journal_mode not in JOURNAL_MODES:
+            raise ValueError("invalid journal_mode %s" % journal_mode)
+        if synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError("invalid synchronous %s" % synchronous)
+        if mmap_size < 0:
+            raise ValueError("invalid mmap_size %d" % mmap_size)
+
         self._connection_string = connection_string
-        self._connection = SQLiteConnection(connection_string, mod_spatialite_path, self)
+        self._connection = SQLiteConnection(connection_string, mod_spatialite_path, self, journal_mode, synchronous,
+                                            mmap_size)
 
-        if table_prefix and not re.match(r"[a-z][_a-z]*(\.[a-z][_a-z]*)*", table_prefix):
+        if table_prefix and not TABLE_PREFIX_PATTERN.match(table_prefix):
             raise ValueError("invalid table_prefix %s" % table_prefix)
         self._table_prefix = table_prefix
+        # Table names (including the table prefix), by namespace name.
+        self._table_names = {}
+        self._validate_on_read = validate_on_read
+        self._composite_indexes = composite_indexes
+        # Set while the secondary indexes are dropped by drop_indexes() (spatial predicates then cannot use the spatial
+        # indexes).
+        self._indexes_dropped = False
 
         self._core_table_name = self._table_name("core")
         self._link_table_name = self._table_name("link")
         self._tag_table_name = self._table_name("tag")
 
+        # INSERT and UPDATE queries, by namespace and (sorted) tuple of field names.
+        self._insert_queries = {}
+        self._update_queries = {}
+
         self._namespace_schemas = {}
         self._sql_builder = sql.SQLBuilder({}, sql.TypeMap(), {}, self._table_name, self._placeholder,
                                            self._placeholder, self._rewriter_property)
 
+    def _column_sql(self, schema, type_map):
+        # Return the column definitions of a namespace table, and the names of its geometry columns (which have to be
+        # added separately using AddGeometryColumn).
+        column_sql, geometry_columns = [], []
+        for name in schema:
+            type_name = type_map[schema[name]]
+            if type_name == "GEOMETRY":
+                geometry_columns.append(name)
+            elif schema.is_optional(name):
+                column_sql.append("%s %s" % (name, type_name))
+            else:
+                column_sql.append("%s %s NOT NULL" % (name, type_name))
+        return column_sql, geometry_columns
+
+    def _create_indexes_sql(self):
+        # Indexes that already exist are skipped, such that create_indexes() can also be used if the indexes have not
+        # been dropped (CreateSpatialIndex() reports an error if the spatial index is already enabled).
+        result = []
+        for table_name, index_name, columns, spatial in self._indexes():
+            if spatial:
+                result.append("SELECT CreateSpatialIndex('%s', '%s') WHERE NOT EXISTS (SELECT 1 FROM geometry_columns "
+                              "WHERE Upper(f_table_name) = Upper('%s') AND Upper(f_geometry_column) = Upper('%s') AND "
+                              "spatial_index_enabled = 1);" % (table_name, columns, table_name, columns))
+            else:
+                result.append("CREATE INDEX IF NOT EXISTS %s ON %s (%s);" % (index_name, table_name, columns))
+        return result
+
     def _create_tables_sql(self):
         result = []
+        type_map = self._type_map()
+        core_table_name = self._core_table_name
+
         # Create the table for the core namespace.
-        column_sql = []
-        schema = self._namespace_schema("core")
-        for name in schema:
-            type_name = self._type_map()[schema[name]]
-            if type_name != "GEOMETRY":
-                sql = name + " " + type_name
-                if not schema.is_optional(name):
-                    sql = sql + " " + "NOT NULL"
-                column_sql.append(sql)
+        column_sql, geometry_columns = self._column_sql(self._namespace_schema("core"), type_map)
         column_sql.append("PRIMARY KEY (uuid)")
         column_sql.append("UNIQUE (archive_path, physical_name)")
         column_sql.append("UNIQUE (product_type, product_name)")
-        result.append("CREATE TABLE %s (%s);" % (self._core_table_name, ", ".join(column_sql)))
-        for name in schema:
-            if self._type_map()[schema[name]] == "GEOMETRY":
-                result.append("SELECT AddGeometryColumn('%s', '%s', 4326, 'GEOMETRY', 2);" %
-                              (self._core_table_name, name,))
-        for name in schema:
-            if schema.has_index(name):
-                if schema[name] == Geometry:
-                    # For the geospatial footprint we need to use a special spatial index
-                    result.append("SELECT CreateSpatialIndex('%s', '%s');" % (self._core_table_name, name))
-                else:
-                    result.append("CREATE INDEX idx_%s_%s ON %s (%s);" %
-                                  (self._core_table_name, name, self._core_table_name, name))
+        result.append("CREATE TABLE %s (%s);" % (core_table_name, ", ".join(column_sql)))
+        result.extend("SELECT AddGeometryColumn('%s', '%s', 4326, 'GEOMETRY', 2);" % (core_table_name, name)
+                      for name in geometry_columns)
 
         # Create the tables for all non-core namespaces.
         for namespace in self._namespace_schemas:
             if namespace == "core":
                 continue
 
-            column_sql = []
-            schema = self._namespace_schema(namespace)
-            for name in schema:
-                type_name = self._type_map()[schema[name]]
-                if type_name != "GEOMETRY":
-                    sql = name + " " + type_name
-                    if not schema.is_optional(name):
-                        sql = sql + " " + "NOT NULL"
-                    column_sql.append(sql)
-            column_sql.append("uuid UUID PRIMARY KEY REFERENCES %s(uuid) ON DELETE CASCADE" %
-                              self._core_table_name)
-            result.append("CREATE TABLE %s (%s);" % (self._table_name(namespace), ", ".join(column_sql)))
-            for name in schema:
-                if self._type_map()[schema[name]] == "GEOMETRY":
-                    result.append("SELECT AddGeometryColumn('%s', '%s', 4326, 'GEOMETRY', 2);" %
-                                  (self._table_name(namespace), name))
-            for name in schema:
-                if schema.has_index(name):
-                    if schema[name] == Geometry:
-                        result.append("SELECT CreateSpatialIndex('%s', '%s');" % (self._table_name(namespace), name))
-                    else:
-                        result.append("CREATE INDEX idx_%s_%s ON %s (%s);" %
-                                      (self._table_name(namespace), name, self._table_name(namespace), name))
+            table_name = self._table_name(namespace)
+            column_sql, geometry_columns = self._column_sql(self._namespace_schema(namespace), type_map)
+            column_sql.append("uuid UUID PRIMARY KEY REFERENCES %s(uuid) ON DELETE CASCADE" % core_table_name)
+            result.append("CREATE TABLE %s (%s);" % (table_name, ", ".join(column_sql)))
+            result.extend("SELECT AddGeometryColumn('%s', '%s', 4326, 'GEOMETRY', 2);" % (table_name, name)
+                          for name in geometry_columns)
 
         # We use explicit 'id' primary keys for the links and tags tables so the entries can be managed using
         # other front-ends that may not support tuples as primary keys.
@@ -302,20 +417,21 @@ class SQLiteBackend(object):
         result.append("CREATE TABLE %s (id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, "
                       "uuid UUID REFERENCES %s(uuid) ON DELETE CASCADE, "
                       "source_uuid UUID NOT NULL, UNIQUE (uuid, source_uuid));" %
-                      (self._link_table_name, self._core_table_name))
-        result.append("CREATE INDEX idx_%s_uuid ON %s (uuid);" % (self._link_table_name, self._link_table_name))
-        result.append("CREATE INDEX idx_%s_source_uuid ON %s (source_uuid);" %
-                      (self._link_table_name, self._link_table_name))
+                      (self._link_table_name, core_table_name))
 
         # Create the table for tags.
         result.append("CREATE TABLE %s (id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, "
                       "uuid UUID REFERENCES %s(uuid) ON DELETE CASCADE, "
-                      "tag TEXT NOT NULL, UNIQUE (uuid, tag));" % (self._tag_table_name, self._core_table_name))
-        result.append("CREATE INDEX idx_%s_uuid ON %s (uuid);" % (self._tag_table_name, self._tag_table_name))
-        result.append("CREATE INDEX idx_%s_tag ON %s (tag);" % (self._tag_table_name, self._tag_table_name))
+                      "tag TEXT NOT NULL, UNIQUE (uuid, tag));" % (self._tag_table_name, core_table_name))
+
+        # Indexes are created after all tables.
+        result.extend(self._create_indexes_sql())
         return result
 
     def _delete_product_properties(self, uuid):
+        # Links to the product as a source product have to be deleted explicitly. The source_uuid column cannot
+        # reference the core table, because source products are allowed to be unknown to the archive. Links from the
+        # product, tags, and namespace properties are deleted by the ON DELETE CASCADE clauses.
         cursor = self._connection.cursor()
         try:
             cursor.execute("DELETE FROM %s WHERE source_uuid = %s" % (self._link_table_name, self._placeholder()),
@@ -332,38 +448,47 @@ class SQLiteBackend(object):
         query = "SELECT uuid FROM %s WHERE source_uuid = %s" % (self._link_table_name, self._placeholder())
         parameters = (uuid,)
 
-        cursor = self._connection.cursor()
-        try:
-            cursor.execute(query, parameters)
-            return [row[0] for row in cursor]
-        finally:
-            cursor.close()
+        return [row[0] for row in self._connection.execute(query, parameters)]
+
+    def _drop_indexes_sql(self):
+        result = []
+        for table_name, index_name, columns, spatial in self._indexes():
+            if spatial:
+                result.append("SELECT DisableSpatialIndex('%s', '%s');" % (table_name, columns))
+                result.append("DROP TABLE IF EXISTS %s;" % index_name)
+            else:
+                result.append("DROP INDEX IF EXISTS %s;" % index_name)
+        return result
 
     def _drop_tables(self):
         with self._connection:
-            cursor = self._connection.cursor()
-            try:
-                # remove geospatial footprint index
-                cursor.execute("SELECT DisableSpatialIndex('%s', '%s')" % (self._core_table_name, 'footprint'))
-                cursor.execute("DROP TABLE IF EXISTS idx_%s_footprint" % self._core_table_name)
-                # first remote all links to geometry columns
-                for namespace in self._namespace_schemas:
-                    schema = self._namespace_schema(namespace)
-                    for name in schema:
-                        if self._type_map()[schema[name]] == "GEOMETRY":
-                            cursor.execute("SELECT DiscardGeometryColumn('%s', '%s')" %
-                                           (self._table_name(namespace), name))
-                # then remove the tables
-                cursor.execute("DROP TABLE IF EXISTS %s" % self._tag_table_name)
-                cursor.execute("DROP TABLE IF EXISTS %s" % self._link_table_name)
-                for namespace in self._namespace_schemas:
-                    if namespace != "core":
-                        cursor.execute("DROP TABLE IF EXISTS %s" % self._table_name(namespace))
-                # remove 'core' table last
-                if "core" in self._namespace_schemas:
-                    cursor.execute("DROP TABLE IF EXISTS %s" % self._core_table_name)
-            finally:
-                cursor.close()
+            self._execute_list(self._drop_tables_sql())
+
+    def _drop_tables_sql(self):
+        result = []
+        type_map = self._type_map()
+
+        # remove the spatial indexes
+        for table_name, index_name, column, spatial in self._indexes():
+            if spatial:
+                result.append("SELECT DisableSpatialIndex('%s', '%s');" % (table_name, column))
+                result.append("DROP TABLE IF EXISTS %s;" % index_name)
+        # first remove all links to geometry columns
+        for namespace in self._namespace_schemas:
+            schema = self._namespace_schema(namespace)
+            for name in schema:
+                if type_map[schema[name]] == "GEOMETRY":
+                    result.append("SELECT DiscardGeometryColumn('%s', '%s');" % (self._table_name(namespace), name))
+        # then remove the tables
+        result.append("DROP TABLE IF EXISTS %s;" % self._tag_table_name)
+        result.append("DROP TABLE IF EXISTS %s;" % self._link_table_name)
+        for namespace in self._namespace_schemas:
+            if namespace != "core":
+                result.append("DROP TABLE IF EXISTS %s;" % self._table_name(namespace))
+        # remove 'core' table last
+        if "core" in self._namespace_schemas:
+            result.append("DROP TABLE IF EXISTS %s;" % self._core_table_name)
+        return result
 
     def _execute_list(self, sql_list):
         cursor = self._connection.cursor()
@@ -392,8 +517,7 @@ class SQLiteBackend(object):
         try:
             cursor.execute(query, (grace_period,) if product_type is None else (grace_period, product_type))
 
-            description = [("core", core_properties)]
-            return [self._unpack_product_properties(description, row) for row in cursor]
+            return list(self._iter_product_properties(cursor, [("core", core_properties)]))
         finally:
             cursor.close()
 
@@ -401,10 +525,10 @@ class SQLiteBackend(object):
                                       archived_only=False):
         core_properties = list(self._namespace_schema("core"))
         select_list = ["%s.%s" % (self._core_table_name, name) for name in core_properties]
-        query = "SELECT %s FROM %s WHERE %s.active AND strftime('%%s', 'now') - strftime('%%s', %s.archive_date) > " \
-                "%s AND NOT EXISTS (SELECT 1 FROM %s WHERE %s.uuid = %s.uuid)" % \
-                (", ".join(select_list), self._core_table_name, self._core_table_name, self._core_table_name,
-                 self._placeholder(), self._link_table_name, self._link_table_name, self._core_table_name)
+        query = "SELECT %s FROM %s LEFT JOIN %s AS link ON (link.uuid = %s.uuid) WHERE %s.active AND " \
+                "strftime('%%s', 'now') - strftime('%%s', %s.archive_date) > %s AND link.uuid IS NULL" % \
+                (", ".join(select_list), self._core_table_name, self._link_table_name, self._core_table_name,
+                 self._core_table_name, self._core_table_name, self._placeholder())
 
         if product_type is not None:
             query = "%s AND product_type = %s" % (query, self._placeholder())
@@ -418,20 +542,50 @@ class SQLiteBackend(object):
         try:
             cursor.execute(query, (grace_period,) if product_type is None else (grace_period, product_type))
 
-            description = [("core", core_properties)]
-            return [self._unpack_product_properties(description, row) for row in cursor]
+            return list(self._iter_product_properties(cursor, [("core", core_properties)]))
         finally:
             cursor.close()
 
+    def _indexes(self):
+        """Return a (table name, index name, indexed column(s), is spatial index) tuple for each secondary index.
+
+        Spatial indexes are managed by spatialite, and are always on a single geometry column.
+
+        """
+        result = []
+        for namespace in ["core"] + [namespace for namespace in self._namespace_schemas if namespace != "core"]:
+            table_name = self._table_name(namespace)
+            schema = self._namespace_schema(namespace)
+            for name in schema:
+                if schema.has_index(name):
+                    result.append((table_name, "idx_%s_%s" % (table_name, name), name, schema[name] == Geometry))
+
+        if self._composite_indexes:
+            # Searches on the validity range of products of a given type can be answered by a single range scan.
+            table_name = self._core_table_name
+            for name in ("validity_start", "validity_stop"):
+                result.append((table_name, "idx_%s_product_type_%s" % (table_name, name), "product_type, %s" % name,
+                               False))
+
+        result.append((self._link_table_name, "idx_%s_uuid" % self._link_table_name, "uuid", False))
+        # The (source_uuid, uuid) index covers lookups of derived products.
+        result.append((self._link_table_name, "idx_%s_source_uuid" % self._link_table_name, "source_uuid, uuid",
+                       False))
+        result.append((self._tag_table_name, "idx_%s_uuid" % self._tag_table_name, "uuid", False))
+        result.append((self._tag_table_name, "idx_%s_tag" % self._tag_table_name, "tag", False))
+        return result
+
     def _insert_namespace_properties(self, uuid, name, properties):
         self._validate_namespace_properties(name, properties)
         assert uuid is not None and getattr(properties, "uuid", uuid) == uuid
 
         # Split the properties into a list of (database) field names and a list of values. This assumes the database
         # field that corresponds to a given property has the same name. If the backend uses different field names, the
-        # required translation can be performed here. Values can also be translated if necessary.
-        properties_dict = vars(properties)
-        fields, parameters = dictkeys(properties_dict), dictvalues(properties_dict)
+        # required translation can be performed here. Values can also be translated if necessary. The field names are
+        # sorted, such that the same query is used for all products that define the same set of properties.
+        properties_dict = properties.__dict__
+        fields = sorted(properties_dict)
+        parameters = [properties_dict[field] for field in fields]
         # Ensure the uuid field is present (for namespaces other than the core namespace this is used as the foreign
         # key).
         if "uuid" not in properties:
@@ -442,9 +596,8 @@ class SQLiteBackend(object):
         parameters = [json.dumps(p) if f != "uuid" and issubclass(schema[f], JSON) else p for f, p in
                       zip(fields, parameters)]
 
-        # Build and execute INSERT query.
-        query = "INSERT INTO %s (%s) VALUES (%s)" % (self._table_name(name), ", ".join(fields),
-                                                     ", ".join([self._placeholder()] * len(fields)))
+        # Execute INSERT query.
+        query = self._insert_query(name, tuple(fields))
 
         cursor = self._connection.cursor()
         try:
@@ -452,6 +605,15 @@ class SQLiteBackend(object):
         finally:
             cursor.close()
 
+    def _insert_query(self, name, fields):
+        key = (name, fields)
+        try:
+            return self._insert_queries[key]
+        except KeyError:
+            query = self._insert_queries[key] = "INSERT INTO %s (%s) VALUES (%s)" % \
+                (self._table_name(name), ", ".join(fields), _placeholder_list(len(fields)))
+            return query
+
     def _delete_namespace_properties(self, uuid, name):
         query = "DELETE FROM %s WHERE uuid=%s" % (self._table_name(name), self._placeholder())
         cursor = self._connection.cursor()
@@ -460,17 +622,24 @@ class SQLiteBackend(object):
         finally:
             cursor.close()
 
+    def _iter_product_properties(self, cursor, description):
+        # Rows are unpacked one at a time as they are stepped from the cursor. Note that the cursor can only be used
+        # while the enclosing transaction is active, so callers that return the results to outside code still need to
+        # collect them into a list first.
+        plan = self._unpack_plan(description)
+        for row in cursor:
+            yield self._unpack_product_properties(plan, row)
+
     def _link(self, uuid, source_uuids):
         query = "INSERT OR IGNORE INTO %s (uuid, source_uuid) VALUES (%s, %s)" % \
             (self._link_table_name, self._placeholder(), self._placeholder())
 
-        for source_uuid in source_uuids:
-            with self._connection:
-                cursor = self._connection.cursor()
-                try:
-                    cursor.execute(query, (uuid, source_uuid))
-                finally:
-                    cursor.close()
+        with self._connection:
+            cursor = self._connection.cursor()
+            try:
+                cursor.executemany(query, [(uuid, source_uuid) for source_uuid in source_uuids])
+            finally:
+                cursor.close()
 
     def _namespace_schema(self, namespace):
         try:
@@ -485,29 +654,10 @@ class SQLiteBackend(object):
             return "?"
 
     def _rewriter_property(self, column_name, subscript):
-        # timestamp
-        if subscript == 'year':
-            return "STRFTIME('%%Y', %s)" % column_name
-        if subscript == 'month':
-            return "STRFTIME('%%m', %s)" % column_name
-        if subscript == 'yearmonth':
-            return "STRFTIME('%%Y-%%m', %s)" % column_name
-        if subscript == 'day':
-            return "STRFTIME('%%d', %s)" % column_name
-        if subscript == 'date':
-            return "STRFTIME('%%Y-%%m-%%d', %s)" % column_name
-        if subscript == 'hour':
-            return "STRFTIME('%%H', %s)" % column_name
-        if subscript == 'minute':
-            return "STRFTIME('%%M', %s)" % column_name
-        if subscript == 'second':
-            return "STRFTIME('%%S', %s)" % column_name
-        if subscript == 'time':
-            return "STRFTIME('%%H:%%M:%%S', %s)" % column_name
-        # text
-        if subscript == 'length':
-            return "LENGTH(%s)" % column_name
-        raise ValueError('Unsupported subscript: %s' % subscript)
+        try:
+            return SUBSCRIPT_FORMATS[subscript] % column_name
+        except KeyError:
+            raise ValueError('Unsupported subscript: %s' % subscript)
 
     def _rewriter_table(self):
         rewriter_table = sql.default_rewriter_table()
@@ -527,18 +677,47 @@ class SQLiteBackend(object):
         #
         # Functions.
         #
-        rewriter_table[Prototype("covers", (Geometry, Geometry), Boolean)] = \
-            lambda arg0, arg1: "(ST_Covers(%s, %s)=1)" % (arg0, arg1)
+        # Spatial predicates on a geometry column with a spatial index first select candidate rows using the R*Tree of
+        # the index, such that the exact (expensive) test is only performed for geometries with a matching MBR. The
+        # spatial index is looked up when the predicate is rewritten, because namespaces can be registered after the
+        # backend has been initialized.
+        def spatial_index_filter(column, mbr_condition, other):
+            index_name = self._spatial_index_name(column)
+            if index_name is None:
+                return None
+
+            return "%s.rowid IN (SELECT pkid FROM %s WHERE %s)" % \
+                (column.rpartition(".")[0], index_name, mbr_condition.format(other=other))
+
+        mbr_intersects_condition = "xmin <= MbrMaxX({other}) AND xmax >= MbrMinX({other}) AND " \
+            "ymin <= MbrMaxY({other}) AND ymax >= MbrMinY({other})"
+        mbr_covers_condition = "xmin <= MbrMinX({other}) AND xmax >= MbrMaxX({other}) AND " \
+            "ymin <= MbrMinY({other}) AND ymax >= MbrMaxY({other})"
+
+        def covers_rewriter(arg0, arg1):
+            predicate = "(ST_Covers(%s, %s)=1)" % (arg0, arg1)
+            # The R*Tree rounds MBRs outwards, so a geometry covered by the other geometry is only guaranteed to have an
+            # MBR that intersects the MBR of the other geometry.
+            index_filter = spatial_index_filter(arg0, mbr_covers_condition, arg1) or \
+                spatial_index_filter(arg1, mbr_intersects_condition, arg0)
+            return predicate if index_filter is None else "(%s AND %s)" % (index_filter, predicate)
+
+        def intersects_rewriter(arg0, arg1):
+            predicate = "(ST_Intersects(%s, %s)=1)" % (arg0, arg1)
+            index_filter = spatial_index_filter(arg0, mbr_intersects_condition, arg1) or \
+                spatial_index_filter(arg1, mbr_intersects_condition, arg0)
+            return predicate if index_filter is None else "(%s AND %s)" % (index_filter, predicate)
+
+        rewriter_table[Prototype("covers", (Geometry, Geometry), Boolean)] = covers_rewriter
 
         rewriter_table[Prototype("distance", (Geometry, Geometry), Real)] = \
             lambda arg0, arg1: "ST_Distance(%s, %s)" % (arg0, arg1)
 
-        rewriter_table[Prototype("intersects", (Geometry, Geometry), Boolean)] = \
-            lambda arg0, arg1: "(ST_Intersects(%s, %s)=1)" % (arg0, arg1)
+        rewriter_table[Prototype("intersects", (Geometry, Geometry), Boolean)] = intersects_rewriter
 
         rewriter_table[Prototype("is_source_of", (UUID,), Boolean)] = \
-            lambda arg0: "EXISTS (SELECT 1 FROM %s WHERE source_uuid = %s.uuid AND uuid = (%s))" % \
-            (self._link_table_name, self._core_table_name, arg0)
+            lambda arg0: "%s.uuid IN (SELECT source_uuid FROM %s WHERE uuid = (%s))" % \
+            (self._core_table_name, self._link_table_name, arg0)
 
         def is_source_of_subquery(where_expr, where_namespaces):
             joins = ''
@@ -553,8 +732,8 @@ class SQLiteBackend(object):
         rewriter_table[Prototype("is_source_of", (Boolean,), Boolean)] = is_source_of_subquery
 
         rewriter_table[Prototype("is_derived_from", (UUID,), Boolean)] = \
-            lambda arg0: "EXISTS (SELECT 1 FROM %s WHERE uuid = %s.uuid AND source_uuid = (%s))" % \
-            (self._link_table_name, self._core_table_name, arg0)
+            lambda arg0: "%s.uuid IN (SELECT uuid FROM %s WHERE source_uuid = (%s))" % \
+            (self._core_table_name, self._link_table_name, arg0)
 
         def is_derived_from_subquery(where_expr, where_namespaces):
             joins = ''
@@ -569,8 +748,8 @@ class SQLiteBackend(object):
         rewriter_table[Prototype("is_derived_from", (Boolean,), Boolean)] = is_derived_from_subquery
 
         rewriter_table[Prototype("has_tag", (Text,), Boolean)] = \
-            lambda arg0: "EXISTS (SELECT 1 FROM %s WHERE uuid = %s.uuid AND tag = (%s))" % \
-            (self._tag_table_name, self._core_table_name, arg0)
+            lambda arg0: "%s.uuid IN (SELECT uuid FROM %s WHERE tag = (%s))" % \
+            (self._core_table_name, self._tag_table_name, arg0)
 
         rewriter_table[Prototype("now", (), Timestamp)] = \
             sql.as_is("datetime(\"now\")")
@@ -599,37 +778,62 @@ class SQLiteBackend(object):
         query = "SELECT source_uuid FROM %s WHERE uuid = %s" % (self._link_table_name, self._placeholder())
         parameters = (uuid,)
 
-        cursor = self._connection.cursor()
-        try:
-            cursor.execute(query, parameters)
-            return [row[0] for row in cursor]
-        finally:
-            cursor.close()
+        return [row[0] for row in self._connection.execute(query, parameters)]
+
+    def _rebuild_spatial_indexes_sql(self):
+        # Spatialite fills a spatial index in table order. Refill it in the order of the Hilbert curve instead, such
+        # that (the MBRs of) nearby geometries end up in the same R*Tree nodes.
+        result = []
+        for table_name, index_name, column, spatial in self._indexes():
+            if spatial:
+                result.append("DELETE FROM %s;" % index_name)
+                result.append("INSERT INTO %s (pkid, xmin, xmax, ymin, ymax) SELECT rowid, MbrMinX(%s), MbrMaxX(%s), "
+                              "MbrMinY(%s), MbrMaxY(%s) FROM %s WHERE %s IS NOT NULL ORDER BY muninn_hilbert_key("
+                              "(MbrMinX(%s) + MbrMaxX(%s)) / 2, (MbrMinY(%s) + MbrMaxY(%s)) / 2);" %
+                              ((index_name,) + (column,) * 4 + (table_name,) + (column,) * 5))
+        return result
+
+    def _statement_cache_size(self):
+        return STATEMENT_CACHE_SIZE + STATEMENT_CACHE_SIZE_PER_NAMESPACE * len(self._namespace_schemas)
+
+    def _spatial_index_name(self, column):
+        """Return the name of the spatial index on a (table qualified) geometry column, or None if there is none (or
+        if the indexes have been dropped).
+
+        """
+        if self._indexes_dropped:
+            return None
+
+        table_name, _, name = column.rpartition(".")
+        for namespace, schema in self._namespace_schemas.items():
+            if self._table_name(namespace) == table_name:
+                if name in schema and schema[name] == Geometry and schema.has_index(name):
+                    return "idx_%s_%s" % (table_name, name)
+                break
+        return None
 
     def _table_name(self, name):
-        return name if not self._table_prefix else self._table_prefix + name
+        try:
+            return self._table_names[name]
+        except KeyError:
+            table_name = self._table_names[name] = name if not self._table_prefix else self._table_prefix + name
+            return table_name
 
     def _tag(self, uuid, tags):
         query = "INSERT OR IGNORE INTO %s (uuid, tag) VALUES (%s, %s)" % \
             (self._tag_table_name, self._placeholder(), self._placeholder())
-        for tag in tags:
-            with self._connection:
-                cursor = self._connection.cursor()
-                try:
-                    cursor.execute(query, (uuid, tag))
-                finally:
-                    cursor.close()
+        with self._connection:
+            cursor = self._connection.cursor()
+            try:
+                cursor.executemany(query, [(uuid, tag) for tag in tags])
+            finally:
+                cursor.close()
 
     def _tags(self, uuid):
         query = "SELECT tag FROM %s WHERE uuid = %s ORDER BY tag" % (self._tag_table_name, self._placeholder())
         parameters = (uuid,)
 
-        cursor = self._connection.cursor()
-        try:
-            cursor.execute(query, parameters)
-            return [row[0] for row in cursor]
-        finally:
-            cursor.close()
+        return [row[0] for row in self._connection.execute(query, parameters)]
 
     def _type_map(self):
         type_map = sql.TypeMap()
@@ -646,22 +850,37 @@ class SQLiteBackend(object):
         return type_map
 
     def _unlink(self, uuid, source_uuids=None):
-        if source_uuids is None:
-            query = "DELETE FROM %s WHERE uuid = %s" % (self._link_table_name, self._placeholder())
-            parameters = (uuid,)
-        else:
-            query = "DELETE FROM %s WHERE uuid = %s AND source_uuid IN (%s)" % \
-                (self._link_table_name, self._placeholder(), ','.join(self._placeholder() * len(source_uuids)))
-            parameters = [uuid] + list(source_uuids)
-
         cursor = self._connection.cursor()
         try:
-            cursor.execute(query, parameters)
+            if source_uuids is None:
+                query = "DELETE FROM %s WHERE uuid = %s" % (self._link_table_name, self._placeholder())
+                cursor.execute(query, (uuid,))
+            else:
+                # Delete in chunks to stay below the maximum number of host parameters of a single SQL statement.
+                # All chunks except the last one are full, and share the same query.
+                source_uuids = list(source_uuids)
+                template = "DELETE FROM %s WHERE uuid = %s AND source_uuid IN (%%s)" % \
+                    (self._link_table_name, self._placeholder())
+                full_chunk_query = template % _placeholder_list(MAX_IN_PARAMETERS)
+                for start in range(0, len(source_uuids), MAX_IN_PARAMETERS):
+                    chunk = source_uuids[start:start + MAX_IN_PARAMETERS]
+                    if len(chunk) == MAX_IN_PARAMETERS:
+                        query = full_chunk_query
+                    else:
+                        query = template % _placeholder_list(len(chunk))
+                    cursor.execute(query, [uuid] + chunk)
         finally:
             cursor.close()
 
-    def _unpack_product_properties(self, description, values):
-        unpacked_properties, start = Struct(), 0
+    def _unpack_plan(self, description):
+        """Return a plan for unpacking rows that match the specified query description.
+
+        The plan contains a (namespace, uuid index, start, end, properties) tuple for each namespace, where properties
+        is a list of (identifier, is optional, is JSON) tuples. Computing this once per query avoids schema lookups
+        for every row.
+
+        """
+        plan, start = [], 0
         for ns_name, ns_description in description:
             end = start + len(ns_description)
 
@@ -670,46 +889,63 @@ class SQLiteBackend(object):
             # Otherwise, only the uuid field is skipped, as it is an implementation detail (foreign key) and it is not
             # part of the namespace itself.
             #
+            uuid_index = None
             if ns_name != "core":
                 assert ns_description[0] == "uuid"
-                if values[start] is None:
-                    # Skip the entire namespace.
-                    start = end
-                    continue
-
-                # Skip the uuid field.
-                start += 1
+                uuid_index = start
                 ns_description = ns_description[1:]
 
-            unpacked_ns_properties = self._unpack_namespace_properties(ns_name, ns_description, values[start:end])
-            self._validate_namespace_properties(ns_name, unpacked_ns_properties, partial=True)
-            unpacked_properties[ns_name] = unpacked_ns_properties
+            schema = self._namespace_schema(ns_name)
+            ns_plan = [(identifier, schema.is_optional(identifier), issubclass(schema[identifier], JSON))
+                       for identifier in ns_description]
+            plan.append((ns_name, uuid_index, end - len(ns_plan), end, ns_plan))
             start = end
 
+        return plan
+
+    def _unpack_product_properties(self, plan, values):
+        unpacked_properties = Struct()
+        for ns_name, uuid_index, start, end, ns_plan in plan:
+            if uuid_index is not None and values[uuid_index] is None:
+                # Skip the entire namespace.
+                continue
+
+            unpacked_ns_properties = self._unpack_namespace_properties(ns_plan, values[start:end])
+            if self._validate_on_read:
+                self._validate_namespace_properties(ns_name, unpacked_ns_properties, partial=True)
+            unpacked_properties[ns_name] = unpacked_ns_properties
+
         return unpacked_properties
 
-    def _unpack_namespace_properties(self, namespace, description, values):
+    def _unpack_namespace_properties(self, plan, values):
         unpacked_properties = Struct()
-        schema = self._namespace_schema(namespace)
-        for identifier, value in zip(description, values):
-            if value is not None or not schema.is_optional(identifier):
-                if issubclass(schema[identifier], JSON):
+        for (identifier, is_optional, is_json), value in zip(plan, values):
+            if value is not None or not is_optional:
+                if is_json:
                     value = json.loads(value)
                 unpacked_properties[identifier] = value
         return unpacked_properties
 
     def _untag(self, uuid, tags=None):
-        if tags is None:
-            query = "DELETE FROM %s WHERE uuid = %s" % (self._tag_table_name, self._placeholder())
-            parameters = (uuid,)
-        else:
-            query = "DELETE FROM %s WHERE uuid = %s AND tag IN (%s)" % \
-                    (self._tag_table_name, self._placeholder(), ','.join(self._placeholder() * len(tags)))
-            parameters = [uuid] + list(tags)
-
         cursor = self._connection.cursor()
         try:
-            cursor.execute(query, parameters)
+            if tags is None:
+                query = "DELETE FROM %s WHERE uuid = %s" % (self._tag_table_name, self._placeholder())
+                cursor.execute(query, (uuid,))
+            else:
+                # Delete in chunks to stay below the maximum number of host parameters of a single SQL statement.
+                # All chunks except the last one are full, and share the same query.
+                tags = list(tags)
+                template = "DELETE FROM %s WHERE uuid = %s AND tag IN (%%s)" % \
+                    (self._tag_table_name, self._placeholder())
+                full_chunk_query = template % _placeholder_list(MAX_IN_PARAMETERS)
+                for start in range(0, len(tags), MAX_IN_PARAMETERS):
+                    chunk = tags[start:start + MAX_IN_PARAMETERS]
+                    if len(chunk) == MAX_IN_PARAMETERS:
+                        query = full_chunk_query
+                    else:
+                        query = template % _placeholder_list(len(chunk))
+                    cursor.execute(query, [uuid] + chunk)
         finally:
             cursor.close()
 
@@ -719,31 +955,25 @@ class SQLiteBackend(object):
 
         # Split the properties into a list of (database) field names and a list of values. This assumes the database
         # field that corresponds to a given property has the same name. If the backend uses different field names, the
-        # required translation can be performed here. Values can also be translated if necessary.
-        properties_dict = vars(properties)
-        fields, parameters = dictkeys(properties_dict), dictvalues(properties_dict)
+        # required translation can be performed here. Values can also be translated if necessary. The field names are
+        # sorted, such that the same query is used for all updates of the same set of properties.
+        properties_dict = properties.__dict__
+
+        # Leave out the uuid field. This field needs to be included in the WHERE clause of the UPDATE query, not in the
+        # SET clause.
+        fields = sorted(field for field in properties_dict if field != "uuid")
         if not fields:
             return  # nothing to do
 
-        # Remove the uuid field if present. This field needs to be included in the WHERE clause of the UPDATE query,
-        # not in the SET clause.
-        try:
-            uuid_index = fields.index("uuid")
-        except ValueError:
-            pass
-        else:
-            del fields[uuid_index]
-            del parameters[uuid_index]
-
         schema = self._namespace_schema(name)
-        parameters = [json.dumps(p) if issubclass(schema[f], JSON) else p for f, p in zip(fields, parameters)]
+        parameters = [json.dumps(properties_dict[f]) if issubclass(schema[f], JSON) else properties_dict[f]
+                      for f in fields]
 
         # Append the uuid (value) at the end of the list of parameters (will be used in the WHERE clause).
         parameters.append(uuid)
 
-        # Build and execute UPDATE query.
-        set_clause = ", ".join(["%s = %s" % (field, self._placeholder()) for field in fields])
-        query = "UPDATE %s SET %s WHERE uuid = %s" % (self._table_name(name), set_clause, self._placeholder())
+        # Execute UPDATE query.
+        query = self._update_query(name, tuple(fields))
 
         cursor = self._connection.cursor()
         try:
@@ -755,20 +985,53 @@ class SQLiteBackend(object):
         finally:
             cursor.close()
 
+    def _update_query(self, name, fields):
+        key = (name, fields)
+        try:
+            return self._update_queries[key]
+        except KeyError:
+            set_clause = ", ".join(["%s = %s" % (field, self._placeholder()) for field in fields])
+            query = self._update_queries[key] = "UPDATE %s SET %s WHERE uuid = %s" % \
+                (self._table_name(name), set_clause, self._placeholder())
+            return query
+
     def _validate_namespace_properties(self, namespace, properties, partial=False):
         self._namespace_schema(namespace).validate(properties, partial)
 
+    @contextlib.contextmanager
+    def bulk_ingest(self):
+        """Context manager for adding large numbers of products (e.g. when restoring an archive).
+
+        The secondary indexes are dropped on entry and recreated on exit (see drop_indexes() and create_indexes()), and
+        transactions are not synced to disk in between. Searches that use spatial predicates on indexed geometry
+        properties are still possible inside the context, but the spatial indexes are not used to evaluate them.
+
+        """
+        self.drop_indexes()
+        synchronous = self._connection.set_synchronous("OFF")
+        try:
+            yield self
+        finally:
+            self._connection.set_synchronous(synchronous)
+            self.create_indexes()
+
     @translate_sqlite_errors
     def count(self, where="", parameters={}):
         query, query_parameters = self._sql_builder.build_count_query(where, parameters)
 
         with self._connection:
-            cursor = self._connection.cursor()
-            try:
-                cursor.execute(query, query_parameters)
-                return cursor.fetchone()[0]
-            finally:
-                cursor.close()
+            return self._connection.execute(query, query_parameters).fetchone()[0]
+
+    @translate_sqlite_errors
+    def create_indexes(self, dry_run=False):
+        """Create the secondary indexes (e.g. after a bulk import for which they were dropped). Indexes that already
+        exist are left in place, but the spatial indexes are always refilled."""
+        sqls = self._create_indexes_sql() + self._rebuild_spatial_indexes_sql()
+        if not dry_run:
+            with self._connection:
+                self._execute_list(sqls)
+            self._indexes_dropped = False
+        return sqls
 
     @translate_sqlite_errors
     def delete_product_properties(self, uuid):
@@ -792,18 +1055,26 @@ class SQLiteBackend(object):
         automatically when required."""
         self._connection.close()
 
+    @translate_sqlite_errors
+    def drop_indexes(self, dry_run=False):
+        """Drop the secondary indexes, such that a bulk import does not have to update them for each product. The
+        indexes can be recreated afterwards using create_indexes(). Until then, spatial predicates on indexed geometry
+        properties (e.g. intersects(core.footprint, ...)) are evaluated without using the spatial indexes."""
+        sqls = self._drop_indexes_sql()
+        if not dry_run:
+            with self._connection:
+                self._execute_list(sqls)
+            self._indexes_dropped = True
+        return sqls
+
     def exists(self):
-        if not os.path.isfile(self._connection_string):
+        # While the connection is open the database file is known to exist (it is created on connect).
+        if not self._connection.is_open() and not os.path.isfile(self._connection_string):
             return False
         with self._connection:
             query = "SELECT name FROM sqlite_master WHERE type='table' AND name=%s" % (self._placeholder(),)
             parameters = (self._core_table_name,)
-            cursor = self._connection.cursor()
-            try:
-                cursor.execute(query, parameters)
-                return len(cursor.fetchall()) != 0
-            finally:
-                cursor.close()
+            return self._connection.execute(query, parameters).fetchone() is not None
 
     @translate_sqlite_errors
     def find_products_without_available_source(self, product_type=None, grace_period=datetime.timedelta()):
@@ -841,7 +1112,7 @@ class SQLiteBackend(object):
     def insert_product_properties(self, properties):
         with self._connection:
             self._insert_namespace_properties(properties.core.uuid, "core", properties.core)
-            for ns_name, ns_properties in vars(properties).items():
+            for ns_name, ns_properties in properties.__dict__.items():
                 if ns_name == "core" or ns_properties is None:
                     continue
                 self._insert_namespace_properties(properties.core.uuid, ns_name, ns_properties)
@@ -854,7 +1125,7 @@ class SQLiteBackend(object):
     def prepare(self, dry_run=False):
         sqls = self._create_tables_sql()
         if not dry_run:
-            if os.path.isfile(self._connection_string):
+            if self._connection.is_open() or os.path.isfile(self._connection_string):
                 with self._connection:
                     self._execute_list(sqls)
             else:
@@ -872,7 +1143,7 @@ class SQLiteBackend(object):
             cursor = self._connection.cursor()
             try:
                 cursor.execute(query, query_parameters)
-                return [self._unpack_product_properties(query_description, row) for row in cursor]
+                return list(self._iter_product_properties(cursor, query_description))
             finally:
                 cursor.close()
 
@@ -895,7 +1166,7 @@ class SQLiteBackend(object):
             cursor = self._connection.cursor()
             try:
                 cursor.execute(query, query_parameters)
-                return [row for row in cursor], query_description
+                return cursor.fetchall(), query_description
             finally:
                 cursor.close()
 
@@ -923,7 +1194,7 @@ class SQLiteBackend(object):
 
         with self._connection:
             self._update_namespace_properties(uuid, "core", properties.core)
-            for ns_name, ns_properties in vars(properties).items():
+            for ns_name, ns_properties in properties.__dict__.items():
                 if ns_name == "core":
                     continue
                 if ns_name in new_namespaces:
@@ -777,15 +777,10 @@ class Identifier(object):
         self.subscript = None
 
         if canonical_identifier == 'tag':
-            # the rules to get the namespace database table name also apply to 'tag'
-            self.namespace = canonical_identifier
-            self.identifier = canonical_identifier
-            self.muninn_type = Text
+            self._init_tag()
 
         elif canonical_identifier == 'count':
-            self.namespace = None
-            self.identifier = canonical_identifier
-            self.muninn_type = Long
+            self._init_count()
 
         elif not re.match(r'[\w]+\.[\w.]+', canonical_identifier):
             raise Error("cannot resolve identifier: %r" % (canonical_identifier,))
@@ -794,36 +789,70 @@ class Identifier(object):
             segments = canonical_identifier.split('.')
 
             if len(segments) == 1:
-                self.namespace = 'core'
-                self.identifier = segments[0]
+                namespace, identifier, subscript = 'core', segments[0], None
 
             elif len(segments) == 2:
                 if segments[0] in namespace_schemas:
-                    self.namespace, self.identifier = segments
+                    namespace, identifier = segments
+                    subscript = None
                 else:
-                    self.namespace = 'core'
-                    self.identifier, self.subscript = segments
+                    namespace = 'core'
+                    identifier, subscript = segments
 
             elif len(segments) == 3:
-                self.namespace, self.identifier, self.subscript = segments
+                namespace, identifier, subscript = segments
 
             else:
                 raise Error("cannot resolve identifier: %r" % (canonical_identifier,))
 
-            # check if namespace is valid
-            if self.namespace not in namespace_schemas:
-                raise Error("undefined namespace: \"%s\"" % self.namespace)
+            self._init_qualified(namespace, identifier, subscript, namespace_schemas)
 
-            # check if property name is valid
-            if self.identifier not in namespace_schemas[self.namespace]:
-                if self.property_name != 'core.validity_duration':
-                    raise Error("no property: %r defined within namespace: %r" % (self.identifier, self.namespace))
-
-            # note: not checking if subscript is valid; the list of possible subscripts varies depending on context
-            if self.property_name == 'core.validity_duration':
-                self.muninn_type = None
-            else:
-                self.muninn_type = namespace_schemas[self.namespace][self.identifier]
+    @classmethod
+    def for_tag(cls):
+        """Return the identifier for the (pseudo) 'tag' property."""
+        self = cls.__new__(cls)
+        self.canonical = 'tag'
+        self.subscript = None
+        self._init_tag()
+        return self
+
+    @classmethod
+    def for_count(cls):
+        """Return the identifier for the (pseudo) 'count' property."""
+        self = cls.__new__(cls)
+        self.canonical = 'count'
+        self.subscript = None
+        self._init_count()
+        return self
+
+    def _init_tag(self):
+        # the rules to get the namespace database table name also apply to 'tag'
+        self.namespace = 'tag'
+        self.identifier = 'tag'
+        self.muninn_type = Text
+
+    def _init_count(self):
+        self.namespace = None
+        self.identifier = 'count'
+        self.muninn_type = Long
+
+    def _init_qualified(self, namespace, identifier, subscript, namespace_schemas):
+        self.namespace, self.identifier, self.subscript = namespace, identifier, subscript
+
+        # check if namespace is valid
+        if self.namespace not in namespace_schemas:
+            raise Error("undefined namespace: \"%s\"" % self.namespace)
+
+        # check if property name is valid
+        if self.identifier not in namespace_schemas[self.namespace]:
+            if self.property_name != 'core.validity_duration':
+                raise Error("no property: %r defined within namespace: %r" % (self.identifier, self.namespace))
+
+        # note: not checking if subscript is valid; the list of possible subscripts varies depending on context
+        if self.property_name == 'core.validity_duration':
+            self.muninn_type = None
+        else:
+            self.muninn_type = namespace_schemas[self.namespace][self.identifier]
 
     @property
     def property_name(self):
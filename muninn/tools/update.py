@@ -78,6 +78,8 @@ def update(args):
         # we only need the uuid and the product_name
         products = archive.search(expression, property_names=['uuid', 'product_name'])
         if args.parallel:
+            # the worker processes open the archive themselves, and must not inherit the database connection
+            archive.close()
             if args.processes is not None:
                 pool = multiprocessing.Pool(args.processes)
             else:
@@ -25,19 +25,28 @@ class TypeVisitor(object):
             return visit_func(visitable, *args, **kwargs)
 
 
-class Visitor(object):
-    def visit(self, visitable, *args, **kwargs):
-        for type_ in inspect.getmro(type(visitable)):
-            try:
-                visit_func = getattr(self, "visit_%s" % type_.__name__)
-            except AttributeError:
-                pass
-            else:
-                return visit_func(visitable, *args, **kwargs)
+# Visit functions, by (visitor type, visitable type).
+_VISIT_FUNCS = {}
 
+
+def _find_visit_func(visitor_type, visitable_type):
+    for type_ in inspect.getmro(visitable_type):
         try:
-            visit_func = getattr(self, "default")
+            return getattr(visitor_type, "visit_%s" % type_.__name__)
         except AttributeError:
             pass
-        else:
-            return visit_func(visitable, *args, **kwargs)
+
+    return getattr(visitor_type, "default", None)
+
+
+class Visitor(object):
+    def visit(self, visitable, *args, **kwargs):
+        # The visit function is looked up only once for each combination of visitor type and visitable type.
+        key = type(self), type(visitable)
+        try:
+            visit_func = _VISIT_FUNCS[key]
+        except KeyError:
+            visit_func = _VISIT_FUNCS[key] = _find_visit_func(*key)
+
+        if visit_func is not None:
+            return visit_func(self, visitable, *args, **kwargs)
@@ -176,6 +176,13 @@ def _makedirs(path):
         os.makedirs(path)
 
 
+def _tag_product(args):
+    # worker function for TestQuery.test_fork (must be defined at module level to be picklable)
+    archive_id, uuid, tag = args
+    with muninn.open(archive_id) as archive:
+        archive.tag(uuid, tag)
+
+
 # this is needed as direct subprocess.Popen is unsafe (eg with database adapter creating threads)
 
 @pytest.fixture(scope='session', autouse=True)
@@ -821,6 +828,10 @@ class TestArchive:
         tags = archive.tags(uuid)
         assert set(tags) == set(['green', 'blue', 'yellow'])
 
+        archive.untag(uuid, [])  # no-op
+        tags = archive.tags(uuid)
+        assert set(tags) == set(['green', 'blue', 'yellow'])
+
         archive.untag(uuid, ['blue', 'yellow'])
         archive.untag(uuid, 'blue')
         tags = archive.tags(uuid)
@@ -846,6 +857,12 @@ class TestArchive:
         uuids = archive.derived_products(uuid_c)
         assert len(uuids) == 0
 
+        archive.unlink(uuid_c, [])  # no-op
+        uuids = archive.derived_products(uuid_a)
+        assert len(uuids) == 2
+        uuids = archive.derived_products(uuid_b)
+        assert len(uuids) == 1
+
         archive.unlink(uuid_c, uuid_b)
         uuids = archive.derived_products(uuid_a)
         assert len(uuids) == 2
@@ -1708,6 +1725,172 @@ class TestQuery:
             s = archive.search('intersects(core.footprint, POLYGON EMPTY)')
             assert len(s) == 0
 
+    def test_geometry_reopen(self, archive):
+        self._prep_data(archive)
+
+        # spatial searches on a newly opened archive (the namespaces are registered after the database backend has been
+        # initialized, so any spatial indexes are only known when a search is performed)
+        with muninn.open('my_arch') as archive2:
+            s = archive2.search('intersects(core.footprint, POLYGON ((1 1, 3 1, 3 3, 1 3, 1 1)))')
+            assert len(s) == 1
+            assert s[0].core.uuid == self.uuid_c
+
+            s = archive2.search('intersects(POLYGON ((11 11, 13 11, 13 13, 11 13, 11 11)), core.footprint)')
+            assert len(s) == 0
+
+            s = archive2.search('covers(core.footprint, POINT (1.0 3.0))')
+            assert len(s) == 1
+            assert s[0].core.uuid == self.uuid_c
+
+    def test_indexes(self, archive):
+        if archive._params['database'] != 'sqlite':  # dropping/creating indexes is specific to the sqlite backend
+            return
+
+        self._prep_data(archive)
+        database = archive._database
+        where = 'intersects(core.footprint, POLYGON ((1 1, 3 1, 3 3, 1 3, 1 1)))'
+
+        assert database.drop_indexes(dry_run=True)
+        assert database.create_indexes(dry_run=True)
+
+        # indexes that already exist are left in place
+        database.create_indexes()
+        database.create_indexes()
+        s = archive.search(where)
+        assert len(s) == 1
+        assert s[0].core.uuid == self.uuid_c
+
+        # spatial searches do not use the spatial indexes while these are dropped
+        database.drop_indexes()
+        s = archive.search(where)
+        assert len(s) == 1
+        assert s[0].core.uuid == self.uuid_c
+
+        database.create_indexes()
+        s = archive.search(where)
+        assert len(s) == 1
+        assert s[0].core.uuid == self.uuid_c
+
+        # products ingested in bulk are included in the recreated indexes
+        polygon = Polygon([LinearRing([Point(2, 2), Point(6, 2), Point(6, 6), Point(2, 6)])])
+        with database.bulk_ingest():
+            uuid = archive.ingest(['data/pi.txt']).core.uuid
+            archive.update_properties(muninn.Struct({'core': {'footprint': polygon}}), uuid, True)
+
+            s = archive.search(where)
+            assert len(s) == 2
+
+        s = archive.search(where)
+        assert len(s) == 2
+        s = archive.search('intersects(core.footprint, POINT (5.0 5.0))')
+        assert len(s) == 1
+        assert s[0].core.uuid == uuid
+
+    def test_reconnect(self, archive):
+        if archive._params['database'] != 'postgresql':
+            return
+
+        self._prep_data(archive)
+        s = archive.search('')
+        assert len(s) == 3
+
+        # terminate the (cached) connection from another session, as would happen after a server restart
+        connection = archive._database._connection
+        with connection:
+            cursor = connection.cursor()
+            cursor.execute('SELECT pg_backend_pid()')
+            pid = cursor.fetchone()[0]
+            cursor.close()
+
+        with muninn.open('my_arch') as archive2:
+            with archive2._database._connection as connection2:
+                cursor = connection2.cursor()
+                cursor.execute('SELECT pg_terminate_backend(%d)' % pid)
+                cursor.close()
+
+        s = archive.search('')
+        assert len(s) == 3
+
+    def test_fork(self, archive):
+        self._prep_data(archive)
+        s = archive.search('')
+        assert len(s) == 3
+
+        # like muninn-update, close the archive before the worker processes are forked, such that these do not inherit
+        # the (open) database connection
+        archive.close()
+        try:
+            pool = multiprocessing.get_context('fork').Pool(2)
+        except (AttributeError, ValueError):
+            pool = multiprocessing.Pool(2)
+        try:
+            pool.map(_tag_product, [('my_arch', product.core.uuid, 'forked') for product in s])
+        finally:
+            pool.close()
+            pool.join()
+
+        archive.tag(self.uuid_a, 'parent')
+        s = archive.search('has_tag("forked")')
+        assert len(s) == 3
+        assert sorted(archive.tags(self.uuid_a)) == ['forked', 'parent']
+
+    def test_duplicate_tags_links(self, archive):
+        self._prep_data(archive)
+
+        # duplicate values, and rows that already exist, are skipped
+        archive.tag(self.uuid_a, ['x', 'y', 'x'])
+        archive.tag(self.uuid_a, ['y', 'z', 'z'])
+        assert sorted(archive.tags(self.uuid_a)) == ['x', 'y', 'z']
+
+        archive.link(self.uuid_c, [self.uuid_a, self.uuid_a, self.uuid_b])
+        assert sorted(archive.source_products(self.uuid_c)) == sorted([self.uuid_a, self.uuid_b])
+
+        # concurrent inserts of the same rows
+        tags = ['tag%d' % i for i in range(20)]
+        archive.close()
+        try:
+            pool = multiprocessing.get_context('fork').Pool(4)
+        except (AttributeError, ValueError):
+            pool = multiprocessing.Pool(4)
+        try:
+            pool.map(_tag_product, [('my_arch', self.uuid_b, tags)] * 8)
+        finally:
+            pool.close()
+            pool.join()
+        assert sorted(archive.tags(self.uuid_b)) == sorted(tags)
+
+        if archive._params['database'] == 'postgresql':
+            # the fallback after a unique violation (caused by a concurrent transaction)
+            database = archive._database
+            database._insert_missing_one_by_one(database._tag_table_name, 'tag', self.uuid_b, ['tag0', 'extra'])
+            database._insert_missing_one_by_one(database._link_table_name, 'source_uuid', self.uuid_b,
+                                                [self.uuid_a, self.uuid_c])
+            assert sorted(archive.tags(self.uuid_b)) == sorted(tags + ['extra'])
+            assert sorted(archive.source_products(self.uuid_b)) == sorted([self.uuid_a, self.uuid_c])
+
+    def test_sqlite_options(self, archive):
+        if archive._params['database'] != 'sqlite':
+            return
+
+        self._prep_data(archive)
+        s = archive.search('size == 1015')
+        assert len(s) == 3
+
+        # default settings
+        connection = archive._database._connection._connection
+        assert connection.execute('PRAGMA journal_mode;').fetchone()[0] == 'wal'
+        assert connection.execute('PRAGMA synchronous;').fetchone()[0] == 1  # NORMAL
+        assert connection.execute('PRAGMA mmap_size;').fetchone()[0] in (0, 268435456)  # 0 if mmap is unsupported
+
+        # invalid settings
+        from muninn.database.sqlite import SQLiteBackend
+        with pytest.raises(ValueError):
+            SQLiteBackend('/tmp/my_arch.db', journal_mode='wall')
+        with pytest.raises(ValueError):
+            SQLiteBackend('/tmp/my_arch.db', synchronous='sometimes')
+        with pytest.raises(ValueError):
+            SQLiteBackend('/tmp/my_arch.db', mmap_size=-1)
+
     def test_alt_number_bases(self, archive):
         self._prep_data(archive)
         s = archive.search('size == %s' % hex(1015))
@@ -2100,3 +2283,15 @@ class TestGeometry:
             geometry = Geometry.from_geojson(geojson)
             geometry_wrapped = Geometry.from_geojson(geojson_wrapped)
             assert geometry.wrap() == geometry_wrapped
+
+    def test_blob_geometry(self):
+        from muninn.database.blobgeometry import encode_blob_geometry, decode_blob_geometry
+        import struct
+
+        point = Point(1.0, 2.0)
+        assert decode_blob_geometry(encode_blob_geometry(point)) == point
+
+        # a polygon with three empty rings has the same size as a point
+        blob = struct.pack('<BBIddddB', 0, 1, 4326, 0, 0, 0, 0, 0x7c) + struct.pack('<IIIII', 3, 3, 0, 0, 0) + b'\xfe'
+        assert len(blob) == len(encode_blob_geometry(point))
+        assert decode_blob_geometry(blob) == Polygon([LinearRing([]), LinearRing([]), LinearRing([])])